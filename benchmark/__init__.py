@@ -0,0 +1 @@
+__all__ = ["startup", "hot_paths"]
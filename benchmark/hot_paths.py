@@ -0,0 +1,267 @@
+from typing import Callable, Dict, List, Sequence
+from shapely.geometry import Polygon
+from shapely.affinity import rotate, scale, translate
+from data.plot_data import PlotData
+from data.featurize import featurize_frame
+from plot_shape_estimator import PlotShapeEstimator
+from preprocess import PlotDataPreprocessor, PreprocessedDataWriter, PREPROCESSED_DATA_COLUMNS
+from utils.utils import ShapeLabel
+
+import utils.utils as utils
+import utils.vectorized as vectorized
+
+import os
+import sys
+import csv
+import glob
+import json
+import time
+import argparse
+import platform
+import tempfile
+import subprocess
+import contextlib
+import shapely
+import shapely.ops
+import numpy as np
+
+
+
+BENCHMARK_REPEAT = 3
+BENCHMARK_SYNTHETIC_COUNT = 500
+BENCHMARK_END_DATA_COUNT = 1000
+BENCHMARK_IMAGE_COUNT = 50
+END_DATA_PATH = os.path.join("data", "end_data")
+
+# base shapes of plot_shape_estimator's examples
+SYNTHETIC_BASE_PLOTS = [
+    Polygon([[0, 0], [2, 0], [1, 3], [0, 3]]),
+    Polygon([[-0.5, 0], [2, 0.5], [1, 3], [0, 3]]),
+    Polygon([[0, 0], [1, 0], [1, 1], [0, 1]]),
+    Polygon([[0, 0], [5, 0], [5, 2], [0, 2]]),
+    Polygon([[0, 0], [2, 3], [1.5, 4], [0, 1.5]]),
+    Polygon([[0, 0], [2, 2], [4, 0]]),
+    Polygon([[0, 0], [2, 2], [5.5, 5], [3, 0]]),
+    shapely.ops.unary_union([Polygon([[0, 0], [0, 5], [5, 5], [5, 0]]), Polygon([[0, 5], [-5, 5], [-5, 4], [0, 4]])]),
+]
+
+
+def get_synthetic_plots(count: int = BENCHMARK_SYNTHETIC_COUNT, seed: int = 0) -> List[Polygon]:
+    """randomly rotated, scaled and translated copies of the example plots, sized like real parcels"""
+    rng = np.random.default_rng(seed)
+
+    synthetic_plots = []
+    for pi in range(count):
+        plot = SYNTHETIC_BASE_PLOTS[pi % len(SYNTHETIC_BASE_PLOTS)]
+        plot = scale(plot, *rng.uniform(2, 6, 2), origin="centroid")
+        plot = rotate(plot, rng.uniform(0, 360), origin="centroid")
+        synthetic_plots.append(translate(plot, *rng.uniform(0, 1000, 2)))
+
+    return synthetic_plots
+
+
+def get_end_data_plots(count: int = BENCHMARK_END_DATA_COUNT) -> List[Polygon]:
+    """plot geometries of data/end_data in label file order"""
+    end_data_plots = []
+    for end_data_path in sorted(glob.glob(os.path.join(END_DATA_PATH, "*.csv"))):
+        plot_data_df = utils.read_plot_data(end_data_path, columns=["plot_geometry_wkt"])
+        end_data_plots.extend(shapely.from_wkt(plot_data_df.plot_geometry_wkt.values))
+
+    return end_data_plots[:count]
+
+
+def get_latency_result(function: Callable, args_list: Sequence[tuple], repeat: int, rows_per_call: int = 1) -> dict:
+    """per call latency percentiles and row throughput after one untimed warm-up call, calls raising are counted"""
+    with contextlib.suppress(Exception):
+        function(*args_list[0])
+
+    latencies = []
+    error_count = 0
+    for _ in range(repeat):
+        for args in args_list:
+            start = time.perf_counter()
+            try:
+                function(*args)
+            except Exception:
+                error_count += 1
+            latencies.append(time.perf_counter() - start)
+
+    latencies = np.array(latencies)
+    return {
+        "call_count": len(latencies),
+        "error_count": error_count,
+        "rows_per_s": len(latencies) * rows_per_call / latencies.sum() if latencies.sum() > 0 else 0.0,
+        "p50_ms": float(np.percentile(latencies, 50) * 1000),
+        "p99_ms": float(np.percentile(latencies, 99) * 1000),
+        "mean_ms": float(latencies.mean() * 1000),
+    }
+
+
+def get_valid_plots(plots: List[Polygon]) -> List[PlotData]:
+    valid_plots = []
+    for plot in plots:
+        try:
+            valid_plots.append(PlotData(plot))
+        except Exception:
+            continue
+
+    return valid_plots
+
+
+def write_preprocessed_data(plots: List[PlotData]) -> None:
+    """PreprocessedDataWriter run into a fresh directory, the buffered replacement of __save_data_to_csv"""
+    with tempfile.TemporaryDirectory() as preprocessed_data_path:
+        writer = PreprocessedDataWriter(preprocessed_data_path)
+        for plot in plots:
+            writer.write(plot)
+        writer.flush()
+
+
+def merge_plot_image(plots: List[PlotData]) -> None:
+    """PlotDataPreprocessor.merge_plot_image of plots written to a temporary csv"""
+    with tempfile.TemporaryDirectory() as image_path:
+        preprocessed_data_path = os.path.join(image_path, "plots.csv")
+        with open(preprocessed_data_path, "w", newline="") as f:
+            writer = csv.writer(f, lineterminator="\n")
+            writer.writerow(PREPROCESSED_DATA_COLUMNS)
+            writer.writerows(plot.all_plot_data for plot in plots)
+
+        # the progress line would land in the json on stdout
+        PlotDataPreprocessor.merge_plot_image(
+            preprocessed_data_path, os.path.join(image_path, "plots.png"), reports_progress=False
+        )
+
+
+def get_benchmark_result(
+    plots: List[Polygon], repeat: int = BENCHMARK_REPEAT, backends: List[str] = None, image_count: int = BENCHMARK_IMAGE_COUNT
+) -> Dict[str, dict]:
+    """timings of the featurization, labelling, inference and writing hot paths over plots"""
+    backends = PlotShapeEstimator.backends if backends is None else backends
+
+    valid_plots = get_valid_plots(plots)
+    simplified_plots = [(plot.plot_geometry,) for plot in valid_plots]
+    label_args = [
+        (plot.plot_geometry, plot.plot_obb_ratio, plot.plot_aspect_ratio, plot.plot_interior_angle_sum)
+        for plot in valid_plots
+    ]
+
+    benchmark_result = {
+        "plot_count": len(plots),
+        "valid_plot_count": len(valid_plots),
+        "utils.get_simplified_polygon": get_latency_result(utils.get_simplified_polygon, [(p,) for p in plots], repeat),
+        "utils.get_exploded_linestring": get_latency_result(
+            utils.get_exploded_linestring, [(p.boundary,) for p, in simplified_plots], repeat
+        ),
+        "utils.get_aspect_ratio": get_latency_result(utils.get_aspect_ratio, simplified_plots, repeat),
+        "utils.get_obb_ratio": get_latency_result(utils.get_obb_ratio, simplified_plots, repeat),
+        "utils.get_interior_angle_sum": get_latency_result(utils.get_interior_angle_sum, simplified_plots, repeat),
+        "utils.get_longest_segment": get_latency_result(utils.get_longest_segment, simplified_plots, repeat),
+        "utils.get_cutted_mass": get_latency_result(
+            utils.get_cutted_mass, [(p, ShapeLabel.LongSquareShape.name) for p, in simplified_plots], repeat
+        ),
+        "utils.get_estimated_shape_label": get_latency_result(utils.get_estimated_shape_label, label_args, repeat),
+        "vectorized.get_cutted_masses": get_latency_result(
+            vectorized.get_cutted_masses,
+            [([p for p, in simplified_plots], [ShapeLabel.LongSquareShape.name] * len(simplified_plots))],
+            repeat,
+            len(simplified_plots),
+        ),
+        "PlotData": get_latency_result(PlotData, [(p,) for p in plots], repeat),
+        "featurize_frame": get_latency_result(featurize_frame, [(plots,)], repeat, len(plots)),
+        "PreprocessedDataWriter": get_latency_result(
+            write_preprocessed_data, [(valid_plots,)], repeat, len(valid_plots)
+        ),
+    }
+
+    for backend in backends:
+        plot_shape_estimator = PlotShapeEstimator(backend)
+        plot_shape_estimator.warmup(backend)
+
+        benchmark_result[f"PlotShapeEstimator.estimate ({backend})"] = get_latency_result(
+            plot_shape_estimator.estimate, [(p,) for p in valid_plots], repeat
+        )
+        benchmark_result[f"PlotShapeEstimator.estimate_many ({backend})"] = get_latency_result(
+            plot_shape_estimator.estimate_many, [(valid_plots,)], repeat, len(valid_plots)
+        )
+
+    if image_count > 0:
+        benchmark_result["PlotDataPreprocessor.merge_plot_image"] = get_latency_result(
+            merge_plot_image, [(valid_plots[:image_count],)], 1, len(valid_plots[:image_count])
+        )
+
+    return benchmark_result
+
+
+def get_environment() -> Dict[str, str]:
+    """commit and library versions to tell benchmark results apart"""
+    try:
+        commit = subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+
+    return {
+        "commit": commit,
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "shapely": shapely.__version__,
+        "geos": ".".join(map(str, shapely.geos_version)),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+    }
+
+
+def get_compared_result(benchmark_result: dict, baseline_result: dict) -> Dict[str, Dict[str, float]]:
+    """p50 latency and throughput ratios of the current over the baseline result, per dataset and case"""
+    compared_result = {}
+    for dataset, cases in benchmark_result["datasets"].items():
+        baseline_cases = baseline_result["datasets"].get(dataset, {})
+        for case, result in cases.items():
+            baseline = baseline_cases.get(case)
+            if not isinstance(result, dict) or not isinstance(baseline, dict) or baseline["p50_ms"] == 0:
+                continue
+
+            compared_result[f"{dataset}/{case}"] = {
+                "p50_ratio": result["p50_ms"] / baseline["p50_ms"],
+                "rows_per_s_ratio": result["rows_per_s"] / baseline["rows_per_s"] if baseline["rows_per_s"] else None,
+            }
+
+    return compared_result
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="time featurization, labelling, inference and writing hot paths")
+    parser.add_argument("--datasets", nargs="+", default=["synthetic", "end_data"], choices=["synthetic", "end_data"])
+    parser.add_argument("--synthetic-count", type=int, default=BENCHMARK_SYNTHETIC_COUNT)
+    parser.add_argument("--end-data-count", type=int, default=BENCHMARK_END_DATA_COUNT)
+    parser.add_argument("--repeat", type=int, default=BENCHMARK_REPEAT)
+    parser.add_argument("--backends", nargs="+", default=PlotShapeEstimator.backends, choices=PlotShapeEstimator.backends)
+    parser.add_argument("--image-count", type=int, default=BENCHMARK_IMAGE_COUNT, help="0 skips merge_plot_image")
+    parser.add_argument("--output", help="json path, stdout if omitted")
+    parser.add_argument("--compare", help="baseline json path to print ratios against")
+    args = parser.parse_args()
+
+    datasets = {
+        "synthetic": lambda: get_synthetic_plots(args.synthetic_count),
+        "end_data": lambda: get_end_data_plots(args.end_data_count),
+    }
+
+    benchmark_result = {
+        "environment": get_environment(),
+        "repeat": args.repeat,
+        "datasets": {
+            dataset: get_benchmark_result(datasets[dataset](), args.repeat, args.backends, args.image_count)
+            for dataset in args.datasets
+        },
+    }
+
+    if args.compare is not None:
+        with open(args.compare) as f:
+            benchmark_result["compared"] = get_compared_result(benchmark_result, json.load(f))
+
+    if args.output is None:
+        json.dump(benchmark_result, sys.stdout, indent=2)
+    else:
+        with open(args.output, "w") as f:
+            json.dump(benchmark_result, f, indent=2)
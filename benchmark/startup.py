@@ -0,0 +1,75 @@
+from typing import Dict, List
+
+import os
+import sys
+import json
+import argparse
+import subprocess
+import statistics
+
+
+
+STARTUP_MODULES = [
+    "plot_shape_estimator",
+    "preprocess",
+    "data.plot_data",
+    "data.featurize",
+    "utils.utils",
+]
+STARTUP_REPEAT = 5
+
+# first prediction includes deferred model loading
+FIRST_PREDICTION_CODE = """
+from shapely.geometry import Polygon
+from data.plot_data import PlotData
+from plot_shape_estimator import PlotShapeEstimator
+PlotShapeEstimator("{backend}").estimate(PlotData(Polygon([[0, 0], [2, 0], [1, 3], [0, 3]])))
+"""
+
+
+def get_elapsed_times(code: str, repeat: int = STARTUP_REPEAT) -> List[float]:
+    """wall times of running code in fresh interpreters from the repository root"""
+    timed_code = f"import time\nstart = time.perf_counter()\n{code}\nprint(time.perf_counter() - start)"
+    repository_path = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    
+    elapsed_times = []
+    for _ in range(repeat):
+        completed = subprocess.run(
+            [sys.executable, "-c", timed_code],
+            cwd=repository_path,
+            env={**os.environ, "PYTHONPATH": repository_path, "TF_CPP_MIN_LOG_LEVEL": "3"},
+            capture_output=True,
+            text=True,
+            check=True,
+        )
+        elapsed_times.append(float(completed.stdout.strip().splitlines()[-1]))
+        
+    return elapsed_times
+
+
+def get_startup_result(repeat: int = STARTUP_REPEAT, with_first_prediction: bool = True) -> Dict[str, dict]:
+    """import time of each entry module and time to the first prediction"""
+    codes = {f"import {module}": f"import {module}" for module in STARTUP_MODULES}
+    if with_first_prediction:
+        for backend in ["keras", "numpy"]:
+            codes[f"first prediction ({backend})"] = FIRST_PREDICTION_CODE.format(backend=backend)
+    
+    startup_result = {}
+    for name, code in codes.items():
+        elapsed_times = get_elapsed_times(code, repeat)
+        startup_result[name] = {
+            "median_s": statistics.median(elapsed_times),
+            "min_s": min(elapsed_times),
+            "max_s": max(elapsed_times),
+        }
+        
+    return startup_result
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="measure import and first prediction time in fresh interpreters")
+    parser.add_argument("--repeat", type=int, default=STARTUP_REPEAT)
+    parser.add_argument("--no-first-prediction", action="store_true")
+    args = parser.parse_args()
+    
+    print(json.dumps(get_startup_result(args.repeat, not args.no_first_prediction), indent=2))
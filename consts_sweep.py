@@ -0,0 +1,248 @@
+from typing import Dict, Iterator, List, Sequence
+from utils.consts import Consts
+from utils.utils import ShapeLabel, read_plot_data, write_plot_data, get_plot_data_geometries
+from data.relabel import get_geometry_consts_digest, get_label_intermediates_frame
+
+import utils.vectorized as vectorized
+
+import os
+import sys
+import json
+import time
+import yaml
+import argparse
+import itertools
+import contextlib
+import multiprocessing
+import numpy as np
+import pandas
+
+
+
+QA_PATH = os.path.join("data", "QA")
+QA_INVALID_SHAPES_PATH = os.path.join(QA_PATH, "_InvalidShapes.yaml")
+PREPROCESSED_DATA_PATH = os.path.join("data", "preprocessed_data")
+SWEEP_RESULT_PATH = os.path.join(QA_PATH, "_ConstsSweep.csv")
+SWEEP_CHUNK_SIZE = 64
+SWEEP_RANDOM_COUNT = 1000
+
+# candidate values per constant, grids take every combination and random samples draw between the min and max
+SWEEP_SPACE = {
+    "RECTANGLE_OBB_RATIO_BASELINE": [0.84, 0.86, 0.88, 0.9, 0.92],
+    "FLAG_OBB_RATIO_BASELINE": [0.6, 0.65, 0.7, 0.75, 0.8],
+    "TRAPEZOID_OBB_RATIO_BASELINE": [0.5, 0.55, 0.6, 0.65, 0.7],
+    "TRIANGLE_OBB_RATIO_BASELINE": [0.95, 0.97, 0.99],
+    "LONG_SQUARE_SHAPE_ASPECT_RATIO_BASELINE": [1.2, 1.3, 1.4],
+    "TRAPEZOID_CHECKER_EROSION": [0.3, 0.5],
+}
+
+SHAPE_LABEL_NAMES = [shape_label.name for shape_label in ShapeLabel]
+
+# per process label intermediates by geometry Consts digest and QA labels, set once by the pool initializer
+sweep_label_intermediates: Dict[str, Dict[str, np.ndarray]] = {}
+sweep_qa: Dict[str, np.ndarray] = {}
+
+
+@contextlib.contextmanager
+def patch_consts(consts: Dict[str, float]) -> Iterator[None]:
+    """set Consts values for the block and restore the previous ones"""
+    previous_consts = {name: getattr(Consts, name) for name in consts}
+    try:
+        for name, value in consts.items():
+            if not hasattr(Consts, name):
+                raise Exception(f"'{name}' is not in Consts")
+            setattr(Consts, name, value)
+        yield
+
+    finally:
+        for name, value in previous_consts.items():
+            setattr(Consts, name, value)
+
+
+def get_qa_frame(
+    preprocessed_data_path: str = PREPROCESSED_DATA_PATH, invalid_shapes_path: str = QA_INVALID_SHAPES_PATH
+) -> pandas.DataFrame:
+    """curated plots of the QA'd label files, qa_label is the file's label and is_invalid marks _InvalidShapes rows
+
+    rows not marked invalid are the plots of data/end_data, invalid rows are known not to be of their file's label
+    """
+    with open(invalid_shapes_path, "r") as f:
+        invalid_indices = yaml.safe_load(f)["invalid_indices"]
+
+    qa_dfs = []
+    for shape_label, indices in invalid_indices.items():
+        plot_data_df = read_plot_data(os.path.join(preprocessed_data_path, shape_label + ".csv"))
+        is_invalid = np.zeros(len(plot_data_df), dtype=bool)
+        is_invalid[sorted(indices)] = True
+
+        qa_dfs.append(
+            pandas.DataFrame(
+                {
+                    "plot_geometry_wkt": plot_data_df.plot_geometry_wkt,
+                    "qa_label": ShapeLabel[shape_label].value,
+                    "is_invalid": is_invalid,
+                }
+            )
+        )
+
+    return pandas.concat(qa_dfs, ignore_index=True)
+
+
+def get_cached_label_intermediates(
+    qa_df: pandas.DataFrame, geometry_consts: Dict[str, float], processes: int = None
+) -> Dict[str, np.ndarray]:
+    """label intermediates of the QA plots under the geometry Consts, stored next to the QA data by their digest"""
+    with patch_consts(geometry_consts):
+        digest = get_geometry_consts_digest()
+        cache_path = os.path.join(QA_PATH, f"_LabelIntermediates-{digest}.parquet")
+
+        if os.path.exists(cache_path):
+            label_intermediates_df = read_plot_data(cache_path)
+        else:
+            label_intermediates_df = get_label_intermediates_frame(get_plot_data_geometries(qa_df), processes)
+            write_plot_data(label_intermediates_df, cache_path)
+
+    return {column: label_intermediates_df[column].to_numpy() for column in vectorized.LABEL_INTERMEDIATE_COLUMNS}
+
+
+def get_grid_configs(space: Dict[str, List[float]]) -> List[Dict[str, float]]:
+    """every combination of the candidate values"""
+    names = list(space)
+    return [dict(zip(names, values)) for values in itertools.product(*(space[name] for name in names))]
+
+
+def get_random_configs(space: Dict[str, List[float]], count: int = SWEEP_RANDOM_COUNT, seed: int = 0) -> List[Dict[str, float]]:
+    """uniform samples between each constant's min and max candidate, integers for integer candidates
+
+    Consts feeding geometry are drawn from their candidates only, each distinct value needs its own intermediates
+    """
+    rng = np.random.default_rng(seed)
+
+    samples = {}
+    for name, values in space.items():
+        if name in vectorized.GEOMETRY_CONSTS:
+            samples[name] = [values[vi] for vi in rng.integers(0, len(values), count)]
+        elif all(isinstance(value, int) for value in values):
+            samples[name] = rng.integers(min(values), max(values) + 1, count).tolist()
+        else:
+            samples[name] = rng.uniform(min(values), max(values), count).tolist()
+
+    return [{name: samples[name][ci] for name in space} for ci in range(count)]
+
+
+def get_geometry_consts(config: Dict[str, float]) -> Dict[str, float]:
+    """the config's values of Consts feeding geometry, missing ones at their current value"""
+    return {name: config.get(name, getattr(Consts, name)) for name in vectorized.GEOMETRY_CONSTS}
+
+
+def get_sweep_result(config: Dict[str, float]) -> dict:
+    """relabel the QA plots under the config and score it against the curated labels"""
+    with patch_consts({name: value for name, value in config.items() if name not in vectorized.GEOMETRY_CONSTS}):
+        with patch_consts(get_geometry_consts(config)):
+            label_intermediates = sweep_label_intermediates[get_geometry_consts_digest()]
+
+        shape_labels = vectorized.get_relabelled_shape_labels(label_intermediates)[0]
+
+    qa_labels = sweep_qa["qa_label"]
+    is_invalid = sweep_qa["is_invalid"]
+    is_valid_row = ~np.isnan(label_intermediates["plot_obb_ratio"])
+    shape_labels = np.where(is_valid_row, shape_labels, ShapeLabel.UndefinedShape.value)
+
+    is_end_data = ~is_invalid
+    confusion_matrix = np.zeros((len(SHAPE_LABEL_NAMES), len(SHAPE_LABEL_NAMES)), dtype=int)
+    np.add.at(confusion_matrix, (qa_labels[is_end_data], shape_labels[is_end_data]), 1)
+
+    label_counts = confusion_matrix.sum(axis=1)
+    qa_label_values = np.flatnonzero(label_counts)
+    recalls = np.diag(confusion_matrix)[qa_label_values] / label_counts[qa_label_values]
+
+    end_data_agreement_count = np.trace(confusion_matrix)
+    invalid_rejection_count = (shape_labels[is_invalid] != qa_labels[is_invalid]).sum()
+
+    return {
+        **config,
+        "score": (end_data_agreement_count + invalid_rejection_count) / len(qa_labels),
+        "end_data_agreement": end_data_agreement_count / is_end_data.sum(),
+        "end_data_balanced_agreement": recalls.mean(),
+        "invalid_rejection": invalid_rejection_count / max(is_invalid.sum(), 1),
+        **{f"recall_{SHAPE_LABEL_NAMES[li]}": recall for li, recall in zip(qa_label_values, recalls)},
+        "confusion_matrix": json.dumps(
+            {
+                SHAPE_LABEL_NAMES[li]: dict(zip(SHAPE_LABEL_NAMES, confusion_matrix[li].tolist()))
+                for li in qa_label_values
+            }
+        ),
+    }
+
+
+def set_sweep_data(label_intermediates: Dict[str, Dict[str, np.ndarray]], qa: Dict[str, np.ndarray]) -> None:
+    """process pool initializer, the intermediates are sent once per worker instead of once per config"""
+    sweep_label_intermediates.update(label_intermediates)
+    sweep_qa.update(qa)
+
+
+def sweep(
+    configs: Sequence[Dict[str, float]], qa_df: pandas.DataFrame = None, processes: int = None
+) -> pandas.DataFrame:
+    """score every config against the QA labels, best first
+
+    intermediates are computed once per distinct geometry Consts, configs only differing in thresholds are then
+    pure array comparisons, evaluated across a process pool unless processes is None
+    """
+    qa_df = get_qa_frame() if qa_df is None else qa_df
+
+    # the current Consts are scored too as the reference to beat
+    names = sorted({name for config in configs for name in config})
+    current_config = {name: getattr(Consts, name) for name in names}
+    if current_config not in configs:
+        configs = list(configs) + [current_config]
+
+    label_intermediates = {}
+    for geometry_consts in {tuple(get_geometry_consts(config).items()) for config in configs}:
+        geometry_consts = dict(geometry_consts)
+        with patch_consts(geometry_consts):
+            digest = get_geometry_consts_digest()
+        label_intermediates[digest] = get_cached_label_intermediates(qa_df, geometry_consts, processes)
+
+    qa = {"qa_label": qa_df.qa_label.to_numpy(), "is_invalid": qa_df.is_invalid.to_numpy()}
+
+    if processes is None:
+        set_sweep_data(label_intermediates, qa)
+        sweep_results = list(map(get_sweep_result, configs))
+    else:
+        with multiprocessing.Pool(processes, initializer=set_sweep_data, initargs=(label_intermediates, qa)) as pool:
+            sweep_results = pool.map(get_sweep_result, configs, chunksize=SWEEP_CHUNK_SIZE)
+
+    sweep_results_df = pandas.DataFrame(sweep_results).sort_values(
+        ["score", "end_data_balanced_agreement"], ascending=False, kind="mergesort"
+    )
+    sweep_results_df.insert(0, "rank", np.arange(1, len(sweep_results_df) + 1))
+    sweep_results_df["is_current"] = [config == current_config for config in sweep_results_df[names].to_dict("records")]
+
+    return sweep_results_df.reset_index(drop=True)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="score Consts configurations against the QA'd label files")
+    parser.add_argument("--mode", default="grid", choices=["grid", "random"])
+    parser.add_argument("--space", help="json path of {const: [candidates]}, SWEEP_SPACE if omitted")
+    parser.add_argument("--count", type=int, default=SWEEP_RANDOM_COUNT, help="random configs to sample")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--processes", type=int, default=None)
+    parser.add_argument("--output", default=SWEEP_RESULT_PATH)
+    parser.add_argument("--top", type=int, default=10, help="best configs to print")
+    args = parser.parse_args()
+
+    space = SWEEP_SPACE
+    if args.space is not None:
+        with open(args.space) as f:
+            space = json.load(f)
+
+    configs = get_grid_configs(space) if args.mode == "grid" else get_random_configs(space, args.count, args.seed)
+
+    start = time.perf_counter()
+    sweep_results_df = sweep(configs, processes=args.processes)
+    print(f"{len(configs)} configs in {time.perf_counter() - start:.1f}s", file=sys.stderr)
+
+    sweep_results_df.to_csv(args.output, index=False)
+    print(sweep_results_df.drop(columns="confusion_matrix").head(args.top).to_string(index=False))
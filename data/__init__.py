@@ -1 +1 @@
-__all__ = ["data"]
\ No newline at end of file
+__all__ = ["data", "featurize", "feature_cache", "spatial_index", "relabel"]
\ No newline at end of file
@@ -0,0 +1,144 @@
+from typing import Optional, Tuple
+from shapely.geometry import Polygon
+from utils.consts import Consts
+
+import os
+import hashlib
+import sqlite3
+import shapely
+
+
+
+FEATURE_CACHE_PATH = os.path.join("data", "feature_cache.sqlite3")
+FEATURE_CACHE_MAX_ROW = 1_000_000
+FEATURE_CACHE_COMMIT_ROW = 1000
+CACHED_FEATURE_COLUMNS = [
+    "plot_geometry_wkb",
+    "plot_aspect_ratio",
+    "plot_obb_ratio",
+    "plot_interior_angle_sum",
+    "plot_label",
+    "is_rectangle",
+    "is_flag",
+    "is_trapezoid",
+    "is_triangle",
+]
+
+
+def get_consts_digest() -> bytes:
+    """digest of all Consts values, cached features are invalidated when any constant changes"""
+    consts = sorted((name, repr(value)) for name, value in vars(Consts).items() if name.isupper())
+    return hashlib.blake2b(repr(consts).encode(), digest_size=16).digest()
+
+
+def get_geometry_digest(plot_geometry: Polygon) -> bytes:
+    """digest of the geometry's wkb as it is, its vertex order and start vertex included"""
+    return hashlib.blake2b(shapely.to_wkb(plot_geometry), digest_size=16).digest()
+
+
+class FeatureCache:
+    """persistent PlotData features keyed by geometry and Consts digests with least recently used eviction
+
+    Rows are keyed by the exact input geometry, so a hit skips simplification and returns this input's own simplified
+    geometry. Plots that failed keep the error message instead of features. The Consts digest is taken on every
+    lookup, a constant changed while the cache is open misses instead of returning stale features.
+    """
+
+    def __init__(self, cache_path: str = None, max_row: int = FEATURE_CACHE_MAX_ROW) -> None:
+        self.__cache_path = FEATURE_CACHE_PATH if cache_path is None else cache_path
+        self.__max_row = max_row
+        self.__uncommitted_row_count = 0
+
+        self.__connection = sqlite3.connect(self.__cache_path)
+        self.__connection.execute(
+            f"""
+            CREATE TABLE IF NOT EXISTS input_plot_features (
+                key BLOB PRIMARY KEY,
+                {", ".join(CACHED_FEATURE_COLUMNS)},
+                error TEXT,
+                last_access INTEGER
+            )
+            """
+        )
+        self.__connection.execute(
+            "CREATE INDEX IF NOT EXISTS input_plot_features_last_access ON input_plot_features (last_access)"
+        )
+        # rows of the earlier tables were keyed by the normalized input or the simplified ring, none of them can be hit
+        self.__connection.execute("DROP TABLE IF EXISTS features")
+        self.__connection.execute("DROP TABLE IF EXISTS plot_features")
+
+        self.__row_count, last_access = self.__connection.execute(
+            "SELECT COUNT(*), COALESCE(MAX(last_access), 0) FROM input_plot_features"
+        ).fetchone()
+        self.__access_count = last_access
+
+    def __enter__(self) -> "FeatureCache":
+        return self
+
+    def __exit__(self, *_) -> None:
+        self.close()
+
+    def get(self, plot_geometry: Polygon) -> Optional[Tuple]:
+        """cached CACHED_FEATURE_COLUMNS and error of the input geometry, None on a miss
+
+        features are None when the error is set, the input failed before
+        """
+        return self.__get_row(self.__get_key(get_geometry_digest(plot_geometry)))
+
+    def set(self, plot_geometry: Polygon, features: Tuple) -> None:
+        """cache features of the input geometry in CACHED_FEATURE_COLUMNS order, its simplified geometry's wkb first"""
+        self.__set_row(self.__get_key(get_geometry_digest(plot_geometry)), (*features, None))
+
+    def set_error(self, plot_geometry: Polygon, error: str) -> None:
+        """cache the error message of the input geometry that failed"""
+        self.__set_row(self.__get_key(get_geometry_digest(plot_geometry)), (*[None] * len(CACHED_FEATURE_COLUMNS), error))
+
+    def close(self) -> None:
+        self.__connection.commit()
+        self.__connection.close()
+
+    def __get_row(self, key: bytes) -> Optional[Tuple]:
+        """CACHED_FEATURE_COLUMNS and error of the key, its access is recorded on a hit"""
+        row = self.__connection.execute(
+            f"SELECT {', '.join(CACHED_FEATURE_COLUMNS)}, error FROM input_plot_features WHERE key = ?", (key,)
+        ).fetchone()
+
+        if row is not None:
+            self.__connection.execute(
+                "UPDATE input_plot_features SET last_access = ? WHERE key = ?", (self.__get_access(), key)
+            )
+            self.__commit_if_needed()
+
+        return row
+
+    def __set_row(self, key: bytes, row: Tuple) -> None:
+        """insert or replace the row and evict the least recently used rows over max_row"""
+        is_inserted = self.__connection.execute(
+            f"INSERT OR REPLACE INTO input_plot_features VALUES (?, {', '.join('?' * len(row))}, ?)",
+            (key, *row, self.__get_access()),
+        ).rowcount
+        self.__row_count += is_inserted
+
+        if self.__row_count > self.__max_row:
+            self.__row_count = self.__connection.execute("SELECT COUNT(*) FROM input_plot_features").fetchone()[0]
+            self.__connection.execute(
+                "DELETE FROM input_plot_features WHERE key IN "
+                "(SELECT key FROM input_plot_features ORDER BY last_access LIMIT ?)",
+                (max(self.__row_count - self.__max_row, 0),),
+            )
+            self.__row_count = min(self.__row_count, self.__max_row)
+
+        self.__commit_if_needed()
+
+    def __get_key(self, geometry_digest: bytes) -> bytes:
+        return geometry_digest + get_consts_digest()
+
+    def __get_access(self) -> int:
+        self.__access_count += 1
+        return self.__access_count
+
+    def __commit_if_needed(self) -> None:
+        self.__uncommitted_row_count += 1
+        if self.__uncommitted_row_count >= FEATURE_CACHE_COMMIT_ROW:
+            self.__connection.commit()
+            self.__uncommitted_row_count = 0
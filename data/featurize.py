@@ -0,0 +1,160 @@
+from typing import Dict, List, Sequence, Tuple, Union
+from shapely.geometry import Polygon
+from utils.utils import FEATURE_COLUMNS
+from utils.profiler import profiler
+
+import utils.utils as utils
+import utils.vectorized as vectorized
+
+import functools
+import multiprocessing
+import shapely
+import numpy as np
+
+
+
+FEATURIZE_CHUNK_SIZE = 512
+
+
+def get_plot_geometries(plots: Union["geopandas.GeoDataFrame", Sequence[Polygon], Sequence[np.ndarray]]) -> np.ndarray:
+    """GeoDataFrame, GeoSeries, geometry array or ragged coordinate arrays to 1-D geometry array"""
+    if hasattr(plots, "geometry"):
+        return np.asarray(plots.geometry.values, dtype=object)
+
+    if len(plots) > 0 and not isinstance(plots[0], (shapely.Geometry, type(None))):
+        coords_list = [np.asarray(coords, dtype=float)[:, :2] for coords in plots]
+        rings = shapely.linearrings(
+            np.concatenate(coords_list), indices=np.repeat(np.arange(len(coords_list)), [len(c) for c in coords_list])
+        )
+        return shapely.polygons(rings)
+
+    return np.asarray(plots, dtype=object)
+
+
+def get_simplified_polygons(plot_geometries: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """utils.get_simplified_polygon over an array, None and the error message where simplification fails"""
+    simplified_polygons = np.empty(len(plot_geometries), dtype=object)
+    errors = np.empty(len(plot_geometries), dtype=object)
+    for pi, plot_geometry in enumerate(plot_geometries):
+        if plot_geometry is None:
+            errors[pi] = "'plot_geometry' is missing"
+            continue
+
+        try:
+            simplified_polygons[pi] = utils.get_simplified_polygon(plot_geometry)
+        except Exception as e:
+            errors[pi] = f"{type(e).__name__}: {e}"
+
+    return simplified_polygons, errors
+
+
+@profiler.timed("featurize")
+def featurize_frame(
+    plots: Union["geopandas.GeoDataFrame", Sequence[Polygon], Sequence[np.ndarray]],
+    with_wkt: bool = False,
+    with_wkb: bool = False,
+    dtype: type = np.float32,
+    with_intermediates: bool = False,
+) -> Dict[str, np.ndarray]:
+    """columnar PlotData features, model columns and plot_label as dtype arrays with nan and an error for invalid plots
+
+    with_intermediates adds the float64 checker results of vectorized.get_label_intermediates for re-labelling
+    """
+    plot_geometries = get_plot_geometries(plots)
+    count = len(plot_geometries)
+
+    simplified_polygons, errors = get_simplified_polygons(plot_geometries)
+    is_valid = ~shapely.is_missing(simplified_polygons)
+
+    coords, index = vectorized.get_ragged_ring_coords(shapely.get_exterior_ring(simplified_polygons))
+    interior_angle_sums = vectorized.get_ragged_interior_angle_sums(coords, index, count)
+
+    hull_coords, hull_index = vectorized.get_ragged_ring_coords(
+        shapely.get_exterior_ring(shapely.convex_hull(simplified_polygons))
+    )
+    obb_widths, obb_heights = vectorized.get_ragged_obb_sides(hull_coords, hull_index, count)
+    aspect_ratios = np.maximum(obb_widths, obb_heights) / np.minimum(obb_widths, obb_heights)
+    obb_ratios = shapely.area(simplified_polygons) / (obb_widths * obb_heights)
+
+    is_degenerate = is_valid & ~np.isfinite(obb_ratios)
+    errors[is_degenerate] = "'plot_geometry' has a degenerate obb"
+    is_valid &= ~is_degenerate
+    simplified_polygons[~is_valid] = None
+
+    shape_labels, is_rectangle, is_flag, is_trapezoid, is_triangle = vectorized.get_estimated_shape_labels(
+        simplified_polygons, obb_ratios, aspect_ratios, interior_angle_sums
+    )
+
+    columns = {
+        "is_flag": is_flag,
+        "is_rectangle": is_rectangle,
+        "is_trapezoid": is_trapezoid,
+        "is_triangle": is_triangle,
+        "plot_aspect_ratio": aspect_ratios,
+        "plot_interior_angle_sum": interior_angle_sums,
+        "plot_obb_ratio": obb_ratios,
+        "plot_label": shape_labels,
+    }
+
+    features: Dict[str, np.ndarray] = {}
+    for column in FEATURE_COLUMNS + ["plot_label"]:
+        features[column] = np.ascontiguousarray(np.where(is_valid, columns[column], np.nan), dtype=dtype)
+
+    features["is_valid"] = is_valid
+    features["error"] = errors
+    if with_wkt:
+        features["plot_geometry_wkt"] = shapely.to_wkt(simplified_polygons, rounding_precision=-1)
+    if with_wkb:
+        features["plot_geometry_wkb"] = shapely.to_wkb(simplified_polygons)
+    if with_intermediates:
+        label_intermediates = vectorized.get_label_intermediates(
+            simplified_polygons, obb_ratios, aspect_ratios, interior_angle_sums
+        )
+        for column in vectorized.LABEL_INTERMEDIATE_COLUMNS:
+            features[column] = np.where(is_valid, label_intermediates[column], np.nan)
+
+    return features
+
+
+def get_feature_matrix(features: Dict[str, np.ndarray], columns: List[str] = FEATURE_COLUMNS) -> np.ndarray:
+    """stack featurize_frame columns into a contiguous (n, len(columns)) float32 matrix"""
+    return np.ascontiguousarray(np.stack([features[column] for column in columns], axis=1), dtype=np.float32)
+
+
+def featurize_wkbs(
+    plot_geometry_wkbs: Sequence[bytes],
+    with_wkt: bool = False,
+    with_wkb: bool = False,
+    dtype: type = np.float32,
+    with_intermediates: bool = False,
+) -> Dict[str, np.ndarray]:
+    """featurize_frame of wkb plot geometries, unparsable wkb is reported as a missing plot_geometry"""
+    plot_geometries = shapely.from_wkb(np.asarray(plot_geometry_wkbs, dtype=object), on_invalid="ignore")
+    return featurize_frame(plot_geometries, with_wkt, with_wkb, dtype, with_intermediates)
+
+
+def featurize_parallel(
+    plots: Union["geopandas.GeoDataFrame", Sequence[Polygon], Sequence[np.ndarray]],
+    chunk_size: int = FEATURIZE_CHUNK_SIZE,
+    processes: int = None,
+    with_wkt: bool = False,
+    with_wkb: bool = False,
+    dtype: type = np.float32,
+    with_intermediates: bool = False,
+) -> Dict[str, np.ndarray]:
+    """featurize_frame over wkb chunks in a process pool, serial if processes is None, columns in input order"""
+    plot_geometry_wkbs = shapely.to_wkb(get_plot_geometries(plots))
+    chunks = [plot_geometry_wkbs[ci : ci + chunk_size] for ci in range(0, len(plot_geometry_wkbs), chunk_size)]
+    featurize_chunk = functools.partial(
+        featurize_wkbs, with_wkt=with_wkt, with_wkb=with_wkb, dtype=dtype, with_intermediates=with_intermediates
+    )
+    if not chunks:
+        return featurize_chunk(plot_geometry_wkbs)
+
+    if processes is None:
+        chunk_features = list(map(featurize_chunk, chunks))
+    else:
+        with multiprocessing.Pool(processes) as pool:
+            chunk_features = pool.map(featurize_chunk, chunks)
+
+    return {column: np.concatenate([features[column] for features in chunk_features]) for column in chunk_features[0]}
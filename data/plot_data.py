@@ -1,27 +1,101 @@
+from typing import Dict, Iterable, Iterator, List, Sequence
 from shapely.geometry import Polygon, LineString
 from debugvisualizer.debugvisualizer import Plotter
+from data.feature_cache import FeatureCache
+from data.featurize import featurize_parallel, FEATURIZE_CHUNK_SIZE
+from utils.utils import FEATURE_COLUMNS
+from utils.profiler import profiler
 
 import utils.utils as utils
+import utils.vectorized as vectorized
+
+import shapely
+import numpy as np
+
+
+
+PLOT_FEATURE_DTYPES = {
+    "plot_aspect_ratio": np.float64,
+    "plot_obb_ratio": np.float64,
+    "plot_interior_angle_sum": np.float64,
+    "plot_label": np.int8,
+    "is_rectangle": np.int8,
+    "is_flag": np.int8,
+    "is_trapezoid": np.int8,
+    "is_triangle": np.int8,
+}
 
 
 class PlotData:
     """plot data save format class"""
-    def __init__(self, plot_geometry: Polygon):
-        self.__gen_properties(plot_geometry)
+    __slots__ = ("plot_geometry", *PLOT_FEATURE_DTYPES)
+    
+    def __init__(self, plot_geometry: Polygon, cache: FeatureCache = None):
+        if cache is None:
+            self.__gen_properties(utils.get_simplified_polygon(plot_geometry))
+            return
+        
+        cached_row = cache.get(plot_geometry)
+        if cached_row is not None:
+            *cached_features, cached_error = cached_row
+            if cached_error is not None:
+                raise Exception(cached_error)
+            
+            self.__set_cached_properties(cached_features)
+            return
+        
+        try:
+            self.__gen_properties(utils.get_simplified_polygon(plot_geometry))
+            cache.set(plot_geometry, self.__get_cached_features())
+        
+        except Exception as e:
+            cache.set_error(plot_geometry, str(e))
+            raise
+        
+    def __set_cached_properties(self, cached_features: Sequence):
+        """set PlotData's properties from FeatureCache, the geometry is the input's own simplified geometry"""
+        (
+            plot_geometry_wkb,
+            self.plot_aspect_ratio,
+            self.plot_obb_ratio,
+            self.plot_interior_angle_sum,
+            self.plot_label,
+            self.is_rectangle,
+            self.is_flag,
+            self.is_trapezoid,
+            self.is_triangle,
+        ) = cached_features
+        self.plot_geometry = shapely.from_wkb(plot_geometry_wkb)
         
-    def __gen_properties(self, plot_geometry: Polygon):
-        """generate PlotData's all properties"""
+    def __get_cached_features(self) -> tuple:
+        """PlotData's properties in FeatureCache's column order"""
+        return (
+            shapely.to_wkb(self.plot_geometry),
+            self.plot_aspect_ratio,
+            self.plot_obb_ratio,
+            self.plot_interior_angle_sum,
+            self.plot_label,
+            self.is_rectangle,
+            self.is_flag,
+            self.is_trapezoid,
+            self.is_triangle,
+        )
+        
+    def __gen_properties(self, simplified_geometry: Polygon):
+        """generate PlotData's all properties from the simplified plot geometry"""
         self.plot_geometry: Polygon
-        self.plot_geometry = utils.get_simplified_polygon(plot_geometry)
+        self.plot_geometry = simplified_geometry
         
-        self.plot_aspect_ratio: float
-        self.plot_aspect_ratio = utils.get_aspect_ratio(self.plot_geometry)
+        plot_coords = vectorized.get_ring_coords(self.plot_geometry)
         
+        self.plot_aspect_ratio: float
         self.plot_obb_ratio: float
-        self.plot_obb_ratio = utils.get_obb_ratio(self.plot_geometry)
+        with profiler.timer("obb"):
+            self.plot_aspect_ratio, self.plot_obb_ratio = vectorized.get_aspect_ratio_and_obb_ratio(plot_coords)
         
         self.plot_interior_angle_sum: float
-        self.plot_interior_angle_sum = utils.get_interior_angle_sum(self.plot_geometry)
+        with profiler.timer("interior_angle_sum"):
+            self.plot_interior_angle_sum = vectorized.get_interior_angle_sum(plot_coords)
         
         self.plot_label: int
         self.is_rectangle: int
@@ -42,7 +116,10 @@ class PlotData:
             self.plot_interior_angle_sum
         )
         
-        self.all_plot_data = [
+    @property
+    def all_plot_data(self) -> list:
+        """PlotData's properties in preprocessed csv's column order"""
+        return [
             self.plot_aspect_ratio,
             self.plot_obb_ratio,
             self.plot_interior_angle_sum,
@@ -52,4 +129,131 @@ class PlotData:
             self.is_flag,
             self.is_trapezoid,
             self.is_triangle
-        ]
\ No newline at end of file
+        ]
+
+
+class PlotRecord:
+    """lightweight PlotData of a PlotDataBatch row, geometry is kept as wkb and parsed on access"""
+    __slots__ = ("plot_geometry_wkb", *PLOT_FEATURE_DTYPES)
+    
+    def __init__(self, plot_geometry_wkb: bytes, **features):
+        self.plot_geometry_wkb = plot_geometry_wkb
+        for column in PLOT_FEATURE_DTYPES:
+            setattr(self, column, features[column])
+            
+    @property
+    def plot_geometry(self) -> Polygon:
+        return shapely.from_wkb(self.plot_geometry_wkb)
+    
+    @property
+    def all_plot_data(self) -> list:
+        """PlotRecord's properties in preprocessed csv's column order"""
+        return [
+            self.plot_aspect_ratio,
+            self.plot_obb_ratio,
+            self.plot_interior_angle_sum,
+            self.plot_label,
+            self.plot_geometry.wkt,
+            self.is_rectangle,
+            self.is_flag,
+            self.is_trapezoid,
+            self.is_triangle
+        ]
+
+
+class PlotDataBatch:
+    """column storage of many PlotData, features in contiguous arrays and geometries as one wkb buffer with offsets"""
+    
+    def __init__(
+        self, 
+        features: Dict[str, np.ndarray], 
+        plot_geometry_wkbs: Sequence[bytes], 
+        indices: np.ndarray = None, 
+        errors: Dict[int, str] = None,
+    ):
+        self.features = {
+            column: np.ascontiguousarray(features[column], dtype=dtype) for column, dtype in PLOT_FEATURE_DTYPES.items()
+        }
+        
+        wkb_sizes = np.fromiter(map(len, plot_geometry_wkbs), dtype=np.int64, count=len(plot_geometry_wkbs))
+        self.plot_geometry_wkb_offsets = np.concatenate([[0], np.cumsum(wkb_sizes)])
+        self.plot_geometry_wkb_buffer = b"".join(plot_geometry_wkbs)
+        
+        self.indices = np.arange(len(plot_geometry_wkbs)) if indices is None else np.asarray(indices, dtype=np.int64)
+        self.errors = {} if errors is None else errors
+        
+    @classmethod
+    def from_plot_data(cls, plots: Iterable[PlotData]) -> "PlotDataBatch":
+        """pack existing PlotData, values are kept exactly"""
+        plots = list(plots)
+        features = {
+            column: np.array([getattr(plot, column) for plot in plots], dtype=dtype) 
+            for column, dtype in PLOT_FEATURE_DTYPES.items()
+        }
+        
+        return cls(features, [plot.plot_geometry.wkb for plot in plots])
+    
+    @classmethod
+    def from_geometries(
+        cls, plot_geometries: Sequence[Polygon], chunk_size: int = FEATURIZE_CHUNK_SIZE, processes: int = None
+    ) -> "PlotDataBatch":
+        """featurize plot geometries without building PlotData, failed plots are left out and kept in errors by input index
+        
+        features are vectorized and agree with PlotData up to floating point rounding
+        """
+        features = featurize_parallel(
+            plot_geometries, chunk_size=chunk_size, processes=processes, with_wkb=True, dtype=np.float64
+        )
+        
+        is_valid = features["is_valid"]
+        indices = np.flatnonzero(is_valid)
+        errors = {int(pi): features["error"][pi] for pi in np.flatnonzero(~is_valid)}
+        
+        return cls(
+            {column: features[column][is_valid] for column in PLOT_FEATURE_DTYPES},
+            features["plot_geometry_wkb"][is_valid],
+            indices,
+            errors,
+        )
+    
+    def __len__(self) -> int:
+        return len(self.plot_geometry_wkb_offsets) - 1
+    
+    def __getitem__(self, pi: int) -> PlotRecord:
+        return PlotRecord(
+            self.get_plot_geometry_wkb(pi), 
+            **{column: values[pi].item() for column, values in self.features.items()},
+        )
+    
+    def __iter__(self) -> Iterator[PlotRecord]:
+        for pi in range(len(self)):
+            yield self[pi]
+            
+    def get_plot_geometry_wkb(self, pi: int) -> bytes:
+        if not -len(self) <= pi < len(self):
+            raise IndexError(f"'{pi}' is out of PlotDataBatch range")
+        
+        pi %= len(self)
+        return self.plot_geometry_wkb_buffer[self.plot_geometry_wkb_offsets[pi] : self.plot_geometry_wkb_offsets[pi + 1]]
+    
+    def get_plot_geometries(self) -> np.ndarray:
+        """shapely geometries of all rows, parsed on each call"""
+        return shapely.from_wkb([self.get_plot_geometry_wkb(pi) for pi in range(len(self))])
+    
+    def get_feature_matrix(self, columns: List[str] = FEATURE_COLUMNS) -> np.ndarray:
+        """contiguous (n, len(columns)) float32 model input"""
+        return np.ascontiguousarray(np.stack([self.features[column] for column in columns], axis=1), dtype=np.float32)
+    
+    @property
+    def all_plot_data(self) -> List[list]:
+        """rows in preprocessed csv's column order, wkt is built here"""
+        return [record.all_plot_data for record in self]
+    
+    @property
+    def nbytes(self) -> int:
+        return (
+            sum(values.nbytes for values in self.features.values()) 
+            + self.plot_geometry_wkb_offsets.nbytes 
+            + len(self.plot_geometry_wkb_buffer) 
+            + self.indices.nbytes
+        )
@@ -0,0 +1,85 @@
+from typing import Sequence, Union
+from shapely.geometry import Polygon
+from utils.consts import Consts
+from utils.utils import read_plot_data, write_plot_data, get_plot_data_geometries
+from data.featurize import featurize_parallel, get_plot_geometries
+
+import utils.vectorized as vectorized
+
+import os
+import hashlib
+import shapely
+import numpy as np
+import pandas
+
+
+
+LABEL_INTERMEDIATES_PATH = os.path.join("data", "label_intermediates.parquet")
+RELABELLED_COLUMNS = ["plot_label", "is_rectangle", "is_flag", "is_trapezoid", "is_triangle"]
+
+
+def get_geometry_consts_digest() -> str:
+    """digest of the Consts in vectorized.GEOMETRY_CONSTS, stored intermediates are stale when it changes"""
+    consts = [(name, repr(getattr(Consts, name))) for name in vectorized.GEOMETRY_CONSTS]
+    return hashlib.blake2b(repr(consts).encode(), digest_size=8).hexdigest()
+
+
+def get_label_intermediates_frame(
+    plots: Union["geopandas.GeoDataFrame", Sequence[Polygon]], processes: int = None
+) -> pandas.DataFrame:
+    """raw plot geometry, label intermediates, labels, error and geometry Consts digest per plot, nan if invalid"""
+    plot_geometries = get_plot_geometries(plots)
+    features = featurize_parallel(plot_geometries, processes=processes, dtype=np.float64, with_intermediates=True)
+
+    label_intermediates_df = pandas.DataFrame(
+        {
+            "plot_geometry_wkb": shapely.to_wkb(plot_geometries),
+            **{column: features[column] for column in vectorized.LABEL_INTERMEDIATE_COLUMNS + RELABELLED_COLUMNS},
+            "error": features["error"],
+        }
+    )
+    label_intermediates_df["geometry_consts_digest"] = get_geometry_consts_digest()
+
+    return label_intermediates_df
+
+
+def save_label_intermediates(
+    plots: Union["geopandas.GeoDataFrame", Sequence[Polygon]], path: str = LABEL_INTERMEDIATES_PATH, processes: int = None
+) -> pandas.DataFrame:
+    """featurize plots once and store what relabel_plot_data needs, csv, parquet or feather by the path"""
+    label_intermediates_df = get_label_intermediates_frame(plots, processes)
+    write_plot_data(label_intermediates_df, path)
+
+    return label_intermediates_df
+
+
+def relabel_plot_data(path: str = LABEL_INTERMEDIATES_PATH, processes: int = None) -> pandas.DataFrame:
+    """labels and flags of stored plots under the current Consts
+
+    only threshold comparisons run unless a Consts in vectorized.GEOMETRY_CONSTS changed since the rows were stored,
+    then those rows are featurized again from their raw geometry and the file is updated
+    """
+    label_intermediates_df = read_plot_data(path)
+
+    is_stale = (label_intermediates_df.geometry_consts_digest != get_geometry_consts_digest()).to_numpy()
+    if is_stale.any():
+        stale_plot_geometries = get_plot_data_geometries(label_intermediates_df)[is_stale]
+        refreshed_df = get_label_intermediates_frame(stale_plot_geometries, processes)
+        refreshed_df.index = label_intermediates_df.index[is_stale]
+
+        columns = refreshed_df.columns.drop("plot_geometry_wkb")
+        label_intermediates_df.loc[is_stale, columns] = refreshed_df[columns]
+        write_plot_data(label_intermediates_df, path)
+
+    is_valid = label_intermediates_df.error.isna().to_numpy()
+    relabelled = vectorized.get_relabelled_shape_labels(
+        {column: label_intermediates_df[column].to_numpy()[is_valid] for column in vectorized.LABEL_INTERMEDIATE_COLUMNS}
+    )
+
+    label_intermediates_df = label_intermediates_df.copy()
+    for column, values in zip(RELABELLED_COLUMNS, relabelled):
+        relabelled_column = np.full(len(label_intermediates_df), np.nan)
+        relabelled_column[is_valid] = values
+        label_intermediates_df[column] = relabelled_column
+
+    return label_intermediates_df
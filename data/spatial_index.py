@@ -0,0 +1,129 @@
+from __future__ import annotations
+from utils.lazy_import import lazy_import
+from utils.utils import Uaa
+
+import shapely
+import numpy as np
+
+pandas = lazy_import("pandas")
+geopandas = lazy_import("geopandas")
+
+
+
+# parcels closer than this in meters are neighbours, digitized neighbour boundaries rarely meet exactly
+SPATIAL_INDEX_NEIGHBOUR_DISTANCE = 0.1
+SPATIAL_INDEX_NODE_CAPACITY = 10
+
+NEIGHBOUR_FEATURE_COLUMNS = [
+    "road_frontage",
+    "road_frontage_ratio",
+    "road_neighbour_count",
+    "plot_neighbour_count",
+]
+
+
+def get_connected_components(count: int, pairs: np.ndarray) -> np.ndarray:
+    """component label of each of count nodes, the smallest node of its component, given (2, n) index pairs"""
+    labels = np.arange(count)
+    if pairs.shape[1] == 0:
+        return labels
+
+    while True:
+        pair_labels = np.minimum(labels[pairs[0]], labels[pairs[1]])
+        merged_labels = labels.copy()
+        np.minimum.at(merged_labels, pairs[0], pair_labels)
+        np.minimum.at(merged_labels, pairs[1], pair_labels)
+        merged_labels = merged_labels[merged_labels]
+
+        if (merged_labels == labels).all():
+            return labels
+
+        labels = merged_labels
+
+
+class PlotSpatialIndex:
+    """STRtree over city parcels, built once and queried in bulk for fragments and neighbours
+
+    Rows are positions in the indexed GeoDataFrame, which needs PNU, UAA and geometry columns.
+    """
+
+    def __init__(self, plots_data: geopandas.GeoDataFrame, node_capacity: int = SPATIAL_INDEX_NODE_CAPACITY) -> None:
+        self.pnus = plots_data.PNU.to_numpy()
+        self.uaas = pandas.to_numeric(plots_data.UAA, errors="coerce").to_numpy()
+        self.geometries = np.asarray(plots_data.geometry.values, dtype=object)
+        self.tree = shapely.STRtree(self.geometries, node_capacity=node_capacity)
+
+    def __len__(self) -> int:
+        return len(self.geometries)
+
+    def query(self, geometries: np.ndarray, predicate: str = "intersects", distance: float = None) -> np.ndarray:
+        """(2, n) pairs of input positions and indexed rows satisfying the predicate, in one bulk query
+
+        distance is only read by the dwithin predicate
+        """
+        return self.tree.query(geometries, predicate=predicate, distance=distance)
+
+    def get_fragment_groups(self) -> np.ndarray:
+        """per row label of its touching same-PNU fragments, the first row of the group, regardless of row order"""
+        pairs = self.query(self.geometries)
+        pairs = pairs[:, (pairs[0] < pairs[1]) & (self.pnus[pairs[0]] == self.pnus[pairs[1]])]
+
+        return get_connected_components(len(self), pairs)
+
+    def get_neighbour_features(
+        self, plot_geometries: np.ndarray, plot_rows: np.ndarray = None, distance: float = SPATIAL_INDEX_NEIGHBOUR_DISTANCE
+    ) -> pandas.DataFrame:
+        """road frontage length and ratio to perimeter, road and plot neighbour counts of each plot
+
+        plot_rows are the plots' own rows in the index, such as merged plots' first fragment rows, so their own
+        PNU fragments are not counted as neighbours.
+        """
+        plot_geometries = np.asarray(plot_geometries, dtype=object)
+
+        pairs = self.query(plot_geometries, predicate="dwithin", distance=distance)
+        if plot_rows is not None:
+            pairs = pairs[:, self.pnus[plot_rows][pairs[0]] != self.pnus[pairs[1]]]
+
+        is_road = self.uaas[pairs[1]] == Uaa.Road.value
+        is_plot = self.uaas[pairs[1]] == Uaa.Plot.value
+        road_pairs = pairs[:, is_road]
+
+        # roads grown by the distance, so the shared boundary of slightly apart parcels is measured
+        road_rows, road_buffer_indices = np.unique(road_pairs[1], return_inverse=True)
+        road_buffers = shapely.buffer(self.geometries[road_rows], distance, quad_segs=16)
+
+        # each plot's road buffers are united first, a boundary stretch where buffers of adjoining roads overlap
+        # counts once. rows of the (plot, road) table are padded with None, which union_all ignores
+        road_plots, road_plot_indices, road_counts = np.unique(road_pairs[0], return_inverse=True, return_counts=True)
+        order = np.argsort(road_plot_indices, kind="stable")
+        road_positions = np.arange(len(order)) - np.repeat(np.cumsum(road_counts) - road_counts, road_counts)
+        plot_road_buffers = np.full((len(road_plots), road_counts.max(initial=0)), None, dtype=object)
+        plot_road_buffers[road_plot_indices[order], road_positions] = road_buffers[road_buffer_indices[order]]
+
+        plot_count = len(plot_geometries)
+        road_frontage = np.zeros(plot_count)
+        road_frontage[road_plots] = shapely.length(
+            shapely.intersection(
+                shapely.boundary(plot_geometries[road_plots]), shapely.union_all(plot_road_buffers, axis=1)
+            )
+        )
+        perimeter = shapely.length(plot_geometries)
+
+        return pandas.DataFrame(
+            {
+                "road_frontage": road_frontage,
+                "road_frontage_ratio": np.divide(
+                    road_frontage, perimeter, out=np.zeros(plot_count), where=perimeter > 0
+                ),
+                "road_neighbour_count": np.bincount(road_pairs[0], minlength=plot_count),
+                "plot_neighbour_count": self.__get_neighbour_counts(pairs[:, is_plot], plot_count),
+            },
+            columns=NEIGHBOUR_FEATURE_COLUMNS,
+        )
+
+    def __get_neighbour_counts(self, plot_pairs: np.ndarray, plot_count: int) -> np.ndarray:
+        """distinct neighbouring PNUs, a neighbour split into fragments counts once"""
+        neighbours = np.unique(
+            np.column_stack([plot_pairs[0], pandas.factorize(self.pnus[plot_pairs[1]])[0]]), axis=0
+        )
+        return np.bincount(neighbours[:, 0], minlength=plot_count)
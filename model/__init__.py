@@ -0,0 +1 @@
+__all__ = ["npz", "tflite", "train", "compress"]
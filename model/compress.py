@@ -0,0 +1,243 @@
+from typing import Dict, List, Tuple
+from model.npz import KERAS_MODEL_PATH, NPZ_MODEL_PATH, export_npz
+from model.tflite import TFLITE_MODEL_PATH, export_tflite
+from model.train import (
+    TRAINING_MAX_ROW,
+    TRAINING_SEED,
+    TRAINING_PATIENCE,
+    TRAINING_BATCH_SIZE,
+    fit,
+    get_dataset,
+    get_early_stopping_split,
+    get_stratified_split,
+    get_training_data,
+    set_random_seed,
+)
+
+import os
+import sys
+import argparse
+import numpy as np
+import pandas
+
+
+
+PRUNED_NPZ_MODEL_PATH = os.path.join("model", "plot-shape-estimator-pruned.npz")
+DISTILLED_NPZ_MODEL_PATH = os.path.join("model", "plot-shape-estimator-distilled.npz")
+COMPRESSION_REPORT_PATH = os.path.join("model", "compression-report.csv")
+
+# share of each kernel's smallest magnitude weights zeroed, the zeros are left to the npz compression
+PRUNING_SPARSITY = 0.8
+PRUNING_LEARNING_RATE = 0.001
+PRUNING_EPOCHS = 300
+
+DISTILLATION_LAYER_UNITS = [16, 8]
+# weight of the true labels against the teacher's probabilities in the student's targets
+DISTILLATION_LABEL_WEIGHT = 0.5
+DISTILLATION_EPOCHS = 1000
+
+REPORT_SINGLE_ROW_COUNT = 200
+REPORT_REPEAT = 3
+
+
+def get_variant_paths(max_row: int = TRAINING_MAX_ROW) -> Tuple[str, str]:
+    """pruned and distilled npz paths of variants tuned on max_row plots per label, suffixed unless the baseline's cap"""
+    if max_row == TRAINING_MAX_ROW:
+        return PRUNED_NPZ_MODEL_PATH, DISTILLED_NPZ_MODEL_PATH
+
+    suffix = "all" if max_row is None else str(max_row)
+    return tuple(f"{os.path.splitext(path)[0]}-{suffix}.npz" for path in [PRUNED_NPZ_MODEL_PATH, DISTILLED_NPZ_MODEL_PATH])
+
+
+def get_tuning_split(labels: np.ndarray, seed: int = TRAINING_SEED) -> Tuple[np.ndarray, np.ndarray]:
+    """fitting and early stopping rows, both within the train rows of get_stratified_split"""
+    train_indices, _ = get_stratified_split(labels, seed=seed)
+
+    return get_early_stopping_split(labels, train_indices, seed=seed)
+
+
+def get_pruned_model(
+    model_path: str = KERAS_MODEL_PATH,
+    sparsity: float = PRUNING_SPARSITY,
+    max_row: int = TRAINING_MAX_ROW,
+    seed: int = TRAINING_SEED,
+    epochs: int = PRUNING_EPOCHS,
+    patience: int = TRAINING_PATIENCE,
+    batch_size: int = TRAINING_BATCH_SIZE,
+) -> "tf.keras.Model":
+    """the model with the sparsity share of each kernel's smallest weights zeroed, fine-tuned with the zeros held
+
+    fine-tuned on the raw features the model was trained on, rows of the report's held-out split are not used
+    """
+    import tensorflow as tf
+
+    set_random_seed(seed)
+
+    model = tf.keras.models.load_model(model_path)
+    masks = []
+    for layer in model.layers:
+        kernel, bias = layer.get_weights()
+        mask = (np.abs(kernel) > np.quantile(np.abs(kernel), sparsity)).astype(np.float32)
+        layer.set_weights([kernel * mask, bias])
+        masks.append(tf.constant(mask))
+
+    class PruningMask(tf.keras.callbacks.Callback):
+        def on_train_batch_end(self, *_) -> None:
+            for layer, mask in zip(model.layers, masks):
+                layer.kernel.assign(layer.kernel * mask)
+
+    features, labels = get_training_data(max_row=max_row)
+    train_indices, early_stopping_indices = get_tuning_split(labels, seed)
+
+    model.compile(
+        loss="categorical_crossentropy", optimizer=tf.keras.optimizers.Adam(PRUNING_LEARNING_RATE), metrics=["accuracy"]
+    )
+    model.fit(
+        get_dataset(features[train_indices], labels[train_indices], batch_size, seed),
+        validation_data=get_dataset(features[early_stopping_indices], labels[early_stopping_indices], batch_size),
+        epochs=epochs,
+        callbacks=[
+            PruningMask(),
+            tf.keras.callbacks.EarlyStopping(monitor="val_loss", patience=patience, restore_best_weights=True),
+        ],
+        verbose=0,
+    )
+
+    return model
+
+
+def get_distilled_model(
+    model_path: str = KERAS_MODEL_PATH,
+    layer_units: List[int] = DISTILLATION_LAYER_UNITS,
+    label_weight: float = DISTILLATION_LABEL_WEIGHT,
+    max_row: int = TRAINING_MAX_ROW,
+    seed: int = TRAINING_SEED,
+    epochs: int = DISTILLATION_EPOCHS,
+    patience: int = TRAINING_PATIENCE,
+    batch_size: int = TRAINING_BATCH_SIZE,
+) -> "tf.keras.Model":
+    """a network of layer_units hidden widths fitted to the model's probabilities blended with the true labels
+
+    rows of the report's held-out split are only scored by fit, never fitted or early stopped on
+    """
+    import tensorflow as tf
+
+    features, labels = get_training_data(max_row=max_row)
+    teacher_probabilities = np.asarray(tf.keras.models.load_model(model_path).predict_on_batch(features))
+    targets = label_weight * np.eye(teacher_probabilities.shape[1])[labels] + (1 - label_weight) * teacher_probabilities
+
+    train_indices, test_indices = get_stratified_split(labels, seed=seed)
+    student, _ = fit(
+        features, labels, train_indices, test_indices, seed, epochs, patience, batch_size, layer_units, targets
+    )
+
+    return student
+
+
+def get_model_size(path: str) -> int:
+    """bytes of the model file or the SavedModel directory"""
+    if not os.path.isdir(path):
+        return os.path.getsize(path)
+
+    return sum(os.path.getsize(os.path.join(root, file)) for root, _, files in os.walk(path) for file in files)
+
+
+def get_compression_report(
+    variants: Dict[str, Tuple[str, str]],
+    max_row: int = TRAINING_MAX_ROW,
+    seed: int = TRAINING_SEED,
+    repeat: int = REPORT_REPEAT,
+) -> pandas.DataFrame:
+    """size, single row latency, batched throughput and accuracy of each (backend, path) variant
+
+    scored on the held-out rows of get_stratified_split only, the first variant is the baseline the others are
+    compared against
+    """
+    from benchmark.hot_paths import get_latency_result
+    from plot_shape_estimator import PlotShapeEstimator
+
+    features, labels = get_training_data(max_row=max_row)
+    _, test_indices = get_stratified_split(labels, seed=seed)
+    features, labels = features[test_indices], labels[test_indices]
+    single_rows = [(features[ri : ri + 1],) for ri in range(min(REPORT_SINGLE_ROW_COUNT, len(features)))]
+
+    report = []
+    for name, (backend, path) in variants.items():
+        plot_shape_estimator = PlotShapeEstimator(backend, path)
+        _, probabilities = plot_shape_estimator.estimate_features(features)
+        predicted_labels = probabilities.argmax(axis=1)
+
+        single_result = get_latency_result(plot_shape_estimator.estimate_features, single_rows, repeat)
+        batch_result = get_latency_result(plot_shape_estimator.estimate_features, [(features,)], repeat, len(features))
+
+        report.append(
+            {
+                "max_row": "all" if max_row is None else max_row,
+                "variant": name,
+                "backend": backend,
+                "path": path,
+                "size_bytes": get_model_size(path),
+                "single_p50_ms": single_result["p50_ms"],
+                "single_p99_ms": single_result["p99_ms"],
+                "batch_rows_per_s": batch_result["rows_per_s"],
+                "held_out_row_count": len(labels),
+                "accuracy": (predicted_labels == labels).mean(),
+                "predicted_labels": predicted_labels,
+            }
+        )
+
+    report_df = pandas.DataFrame(report)
+    baseline = report_df.iloc[0]
+    report_df["size_ratio"] = report_df.size_bytes / baseline.size_bytes
+    report_df["baseline_agreement"] = [
+        (predicted_labels == baseline.predicted_labels).mean() for predicted_labels in report_df.predicted_labels
+    ]
+
+    return report_df.drop(columns="predicted_labels")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="export quantized, pruned and distilled variants of the model")
+    parser.add_argument("--model-path", default=KERAS_MODEL_PATH)
+    parser.add_argument(
+        "--max-row",
+        type=int,
+        nargs="+",
+        default=[TRAINING_MAX_ROW, 0],
+        help="end data plots per label to tune and score on, 0 for all, one set of variants per value",
+    )
+    parser.add_argument("--sparsity", type=float, default=PRUNING_SPARSITY)
+    parser.add_argument("--layer-units", type=int, nargs="+", default=DISTILLATION_LAYER_UNITS)
+    parser.add_argument("--seed", type=int, default=TRAINING_SEED)
+    parser.add_argument("--report", default=COMPRESSION_REPORT_PATH)
+    parser.add_argument("--skip-export", action="store_true", help="only report the existing variants")
+    args = parser.parse_args()
+
+    if not args.skip_export:
+        export_tflite(args.model_path, TFLITE_MODEL_PATH)
+
+    report_dfs = []
+    for max_row in [None if max_row <= 0 else max_row for max_row in args.max_row]:
+        pruned_path, distilled_path = get_variant_paths(max_row)
+        if not args.skip_export:
+            export_npz(get_pruned_model(args.model_path, args.sparsity, max_row, args.seed), pruned_path, True)
+            export_npz(get_distilled_model(args.model_path, args.layer_units, max_row=max_row, seed=args.seed), distilled_path)
+
+        report_dfs.append(
+            get_compression_report(
+                {
+                    "baseline": ("keras", args.model_path),
+                    "baseline npz": ("numpy", NPZ_MODEL_PATH),
+                    "int8 tflite": ("tflite", TFLITE_MODEL_PATH),
+                    "pruned npz": ("numpy", pruned_path),
+                    "distilled npz": ("numpy", distilled_path),
+                },
+                max_row,
+                args.seed,
+            )
+        )
+
+    report_df = pandas.concat(report_dfs, ignore_index=True)
+    report_df.to_csv(args.report, index=False)
+    report_df.to_string(sys.stdout, index=False)
+    print()
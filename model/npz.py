@@ -0,0 +1,75 @@
+from typing import Union
+
+import os
+import numpy as np
+
+
+
+KERAS_MODEL_PATH = os.path.join("model", "plot-shape-estimator.pb")
+NPZ_MODEL_PATH = os.path.join("model", "plot-shape-estimator.npz")
+NPZ_ACTIVATIONS = ["linear", "relu", "softmax"]
+
+
+def export_npz(
+    model_path: Union[str, "tf.keras.Model"] = KERAS_MODEL_PATH, npz_path: str = NPZ_MODEL_PATH, compressed: bool = False
+) -> None:
+    """dump the dense layers' float32 weights and activations of the keras model or its path to npz, zipped if compressed"""
+    import tensorflow as tf
+    
+    model = tf.keras.models.load_model(model_path) if isinstance(model_path, str) else model_path
+    
+    weights = {}
+    activations = []
+    for li, layer in enumerate(model.layers):
+        if not isinstance(layer, tf.keras.layers.Dense):
+            raise Exception(f"'{layer.name}' is not a dense layer")
+        
+        activation = layer.get_config()["activation"]
+        if activation not in NPZ_ACTIVATIONS:
+            raise Exception(f"'{activation}' activation is not supported")
+        
+        kernel, bias = layer.get_weights()
+        weights[f"kernel_{li}"] = kernel.astype(np.float32)
+        weights[f"bias_{li}"] = bias.astype(np.float32)
+        activations.append(activation)
+        
+    save = np.savez_compressed if compressed else np.savez
+    save(npz_path, activations=np.array(activations), **weights)
+
+
+class NumpyEstimator:
+    """float32 numpy forward pass of the exported dense network, mirrors the keras predict api"""
+    
+    def __init__(self, npz_path: str = NPZ_MODEL_PATH) -> None:
+        with np.load(npz_path) as npz:
+            activations = [str(activation) for activation in npz["activations"]]
+            self.layers = [
+                (npz[f"kernel_{li}"], npz[f"bias_{li}"], activation) for li, activation in enumerate(activations)
+            ]
+            
+        _, class_count = self.layers[-1][0].shape
+        self.output_shape = (None, class_count)
+        
+    def predict_on_batch(self, input_data: np.ndarray) -> np.ndarray:
+        output_data = np.asarray(input_data, dtype=np.float32)
+        for kernel, bias, activation in self.layers:
+            output_data = output_data @ kernel + bias
+            
+            if activation == "relu":
+                np.maximum(output_data, 0, out=output_data)
+            elif activation == "softmax":
+                output_data = self.__get_softmax(output_data)
+                
+        return output_data
+    
+    def predict(self, input_data: np.ndarray) -> np.ndarray:
+        return self.predict_on_batch(input_data)
+    
+    @staticmethod
+    def __get_softmax(logits: np.ndarray) -> np.ndarray:
+        exp = np.exp(logits - logits.max(axis=1, keepdims=True))
+        return exp / exp.sum(axis=1, keepdims=True)
+
+
+if __name__ == "__main__":
+    export_npz()
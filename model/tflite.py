@@ -0,0 +1,59 @@
+from typing import Union
+from model.npz import KERAS_MODEL_PATH
+
+import os
+import numpy as np
+
+
+
+TFLITE_MODEL_PATH = os.path.join("model", "plot-shape-estimator-int8.tflite")
+
+
+def export_tflite(
+    model_path: Union[str, "tf.keras.Model"] = KERAS_MODEL_PATH, tflite_path: str = TFLITE_MODEL_PATH, quantize: bool = True
+) -> None:
+    """convert the keras model or its path to tflite, int8 dynamic-range quantized weights unless quantize is False
+
+    tflite only quantizes weight tensors of more than 1024 values, the other layers stay float32
+    """
+    import tensorflow as tf
+
+    model = tf.keras.models.load_model(model_path) if isinstance(model_path, str) else model_path
+    converter = tf.lite.TFLiteConverter.from_keras_model(model)
+    if quantize:
+        converter.optimizations = [tf.lite.Optimize.DEFAULT]
+
+    with open(tflite_path, "wb") as f:
+        f.write(converter.convert())
+
+
+class TFLiteEstimator:
+    """tflite interpreter of an exported model, mirrors the keras predict api"""
+
+    def __init__(self, tflite_path: str = TFLITE_MODEL_PATH) -> None:
+        import tensorflow as tf
+
+        self.interpreter = tf.lite.Interpreter(model_path=tflite_path)
+        self.input_index = self.interpreter.get_input_details()[0]["index"]
+        self.output_index = self.interpreter.get_output_details()[0]["index"]
+        self.input_shape = None
+
+        _, class_count = self.interpreter.get_output_details()[0]["shape"]
+        self.output_shape = (None, int(class_count))
+
+    def predict_on_batch(self, input_data: np.ndarray) -> np.ndarray:
+        input_data = np.ascontiguousarray(input_data, dtype=np.float32)
+
+        # tensors are only reallocated when the batch size changes
+        if input_data.shape != self.input_shape:
+            self.interpreter.resize_tensor_input(self.input_index, input_data.shape)
+            self.interpreter.allocate_tensors()
+            self.input_shape = input_data.shape
+
+        self.interpreter.set_tensor(self.input_index, input_data)
+        self.interpreter.invoke()
+
+        return self.interpreter.get_tensor(self.output_index)
+
+    def predict(self, input_data: np.ndarray) -> np.ndarray:
+        return self.predict_on_batch(input_data)
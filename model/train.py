@@ -0,0 +1,337 @@
+from typing import Dict, List, Tuple
+from utils.utils import FEATURE_COLUMNS, ShapeLabel, get_data_and_label
+from model.npz import KERAS_MODEL_PATH, export_npz
+
+import os
+import sys
+import json
+import time
+import random
+import hashlib
+import argparse
+import multiprocessing
+import numpy as np
+
+
+
+END_DATA_PATH = os.path.join("data", "end_data")
+TRAINING_CACHE_PATH = os.path.join("model", "training-data.npz")
+TRAINING_SHAPE_LABELS = [shape_label.name for shape_label in ShapeLabel if shape_label != ShapeLabel.UndefinedShape]
+TRAINING_MAX_ROW = 500
+TRAINING_EPOCHS = 1000
+TRAINING_PATIENCE = 100
+TRAINING_BATCH_SIZE = 512
+# Adam's default rate takes thousands of epochs at this batch size
+TRAINING_LEARNING_RATE = 0.01
+TRAINING_FOLDS = 5
+TRAINING_SEED = 1
+TRAINING_VALIDATION_SIZE = 0.4
+# share of the train rows held out for early stopping, the test rows are only scored
+TRAINING_EARLY_STOPPING_SIZE = 0.25
+TRAINING_LAYER_UNITS = [128, 32, 16]
+
+
+def get_training_data_digest(file_format: str, max_row: int) -> str:
+    """digest of the end data files' sizes and modification times and the row cap, the cache key"""
+    training_data_stats = []
+    for shape_label in TRAINING_SHAPE_LABELS:
+        stat = os.stat(os.path.join(END_DATA_PATH, f"{shape_label}.{file_format}"))
+        training_data_stats.append((shape_label, stat.st_size, stat.st_mtime_ns))
+
+    key = repr((training_data_stats, max_row, FEATURE_COLUMNS))
+    return hashlib.blake2b(key.encode(), digest_size=16).hexdigest()
+
+
+def get_training_data(
+    file_format: str = "csv", max_row: int = TRAINING_MAX_ROW, cache_path: str = TRAINING_CACHE_PATH
+) -> Tuple[np.ndarray, np.ndarray]:
+    """float32 FEATURE_COLUMNS matrix and int labels of the end data, read once and cached as a binary array"""
+    digest = get_training_data_digest(file_format, max_row)
+    if os.path.exists(cache_path):
+        with np.load(cache_path) as training_data:
+            if str(training_data["digest"]) == digest:
+                return training_data["features"], training_data["labels"]
+
+    training_data_df = get_data_and_label(file_format, max_row)
+    features = np.ascontiguousarray(training_data_df[FEATURE_COLUMNS].to_numpy(), dtype=np.float32)
+    labels = training_data_df.plot_label.to_numpy(dtype=np.int64)
+    np.savez(cache_path, features=features, labels=labels, digest=digest)
+
+    return features, labels
+
+
+def get_stratified_folds(labels: np.ndarray, folds: int, seed: int = TRAINING_SEED) -> List[np.ndarray]:
+    """test indices of each fold, every label shuffled and split evenly across the folds"""
+    rng = np.random.default_rng(seed)
+
+    fold_indices = [[] for _ in range(folds)]
+    for label in np.unique(labels):
+        label_indices = rng.permutation(np.flatnonzero(labels == label))
+        for fi, indices in enumerate(np.array_split(label_indices, folds)):
+            fold_indices[fi].append(indices)
+
+    return [np.sort(np.concatenate(indices)) for indices in fold_indices]
+
+
+def get_stratified_split(
+    labels: np.ndarray, test_size: float = TRAINING_VALIDATION_SIZE, seed: int = TRAINING_SEED
+) -> Tuple[np.ndarray, np.ndarray]:
+    """train and test indices holding test_size of every label out"""
+    rng = np.random.default_rng(seed)
+
+    test_indices = []
+    for label in np.unique(labels):
+        label_indices = rng.permutation(np.flatnonzero(labels == label))
+        test_indices.append(label_indices[: round(len(label_indices) * test_size)])
+
+    is_test = np.zeros(len(labels), dtype=bool)
+    is_test[np.concatenate(test_indices)] = True
+
+    return np.flatnonzero(~is_test), np.flatnonzero(is_test)
+
+
+def get_early_stopping_split(
+    labels: np.ndarray,
+    train_indices: np.ndarray,
+    early_stopping_size: float = TRAINING_EARLY_STOPPING_SIZE,
+    seed: int = TRAINING_SEED,
+) -> Tuple[np.ndarray, np.ndarray]:
+    """fitting and early stopping indices, both within train_indices, early_stopping_size of every label held out"""
+    fit_indices, early_stopping_indices = get_stratified_split(labels[train_indices], early_stopping_size, seed)
+
+    return train_indices[fit_indices], train_indices[early_stopping_indices]
+
+
+def get_standardization(features: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """per feature mean and standard deviation, 1 for constant features"""
+    std = features.std(axis=0)
+    return features.mean(axis=0), np.where(std > 0, std, 1).astype(np.float32)
+
+
+def set_standardization_folded(model: "tf.keras.Model", mean: np.ndarray, std: np.ndarray) -> None:
+    """fold the standardization into the first dense layer, so the model takes raw features and stays dense only"""
+    kernel, bias = model.layers[0].get_weights()
+    model.layers[0].set_weights([kernel / std[:, np.newaxis], bias - (mean / std) @ kernel])
+
+
+def set_random_seed(seed: int) -> None:
+    """seed python, numpy and tensorflow and make tensorflow ops deterministic, with the apis of tensorflow 2.6"""
+    import tensorflow as tf
+
+    os.environ["TF_DETERMINISTIC_OPS"] = "1"
+    random.seed(seed)
+    np.random.seed(seed)
+    tf.random.set_seed(seed)
+
+
+def get_model(
+    feature_count: int = len(FEATURE_COLUMNS),
+    class_count: int = len(TRAINING_SHAPE_LABELS),
+    learning_rate: float = TRAINING_LEARNING_RATE,
+    layer_units: List[int] = TRAINING_LAYER_UNITS,
+):
+    """the dense network of model/tf.py, hidden layers as wide as layer_units"""
+    import tensorflow as tf
+
+    model = tf.keras.Sequential()
+    model.add(tf.keras.layers.Dense(layer_units[0], input_shape=(feature_count,), activation="relu"))
+    for units in layer_units[1:]:
+        model.add(tf.keras.layers.Dense(units, activation="relu"))
+    model.add(tf.keras.layers.Dense(class_count, activation="softmax"))
+
+    model.compile(loss="categorical_crossentropy", optimizer=tf.keras.optimizers.Adam(learning_rate), metrics=["accuracy"])
+
+    return model
+
+
+def get_dataset(features: np.ndarray, labels: np.ndarray, batch_size: int, seed: int = None):
+    """cached, prefetching tf.data pipeline of one-hot labelled batches, reshuffled every epoch if seeded
+
+    labels may also be (n, class count) target probabilities
+    """
+    import tensorflow as tf
+
+    targets = np.eye(len(TRAINING_SHAPE_LABELS), dtype=np.float32)[labels] if labels.ndim == 1 else labels
+    dataset = tf.data.Dataset.from_tensor_slices((features, targets.astype(np.float32))).cache()
+    if seed is not None:
+        dataset = dataset.shuffle(len(features), seed=seed, reshuffle_each_iteration=True)
+
+    return dataset.batch(batch_size).prefetch(tf.data.AUTOTUNE)
+
+
+def fit(
+    features: np.ndarray,
+    labels: np.ndarray,
+    train_indices: np.ndarray,
+    test_indices: np.ndarray,
+    seed: int = TRAINING_SEED,
+    epochs: int = TRAINING_EPOCHS,
+    patience: int = TRAINING_PATIENCE,
+    batch_size: int = TRAINING_BATCH_SIZE,
+    layer_units: List[int] = TRAINING_LAYER_UNITS,
+    targets: np.ndarray = None,
+) -> Tuple["tf.keras.Model", Dict[str, float]]:
+    """model early stopped on held-out train rows with its best weights, and the run's wall time, epochs and scores
+
+    the early stopping rows are split off the train rows by get_early_stopping_split, the test rows are only scored.
+    trained on features standardized by the fitting rows, the unscaled features and angle sums otherwise leave some
+    seeds' relus dead, the returned model takes raw features. targets are (n, class count) probabilities to fit
+    instead of the labels, such as a teacher model's, the test rows are always scored against the labels
+    """
+    import tensorflow as tf
+
+    set_random_seed(seed)
+
+    start = time.perf_counter()
+
+    fit_indices, early_stopping_indices = get_early_stopping_split(labels, train_indices, seed=seed)
+
+    mean, std = get_standardization(features[fit_indices])
+    standardized_features = (features - mean) / std
+
+    targets = labels if targets is None else targets
+
+    model = get_model(features.shape[1], layer_units=layer_units)
+    history = model.fit(
+        get_dataset(standardized_features[fit_indices], targets[fit_indices], batch_size, seed),
+        validation_data=get_dataset(
+            standardized_features[early_stopping_indices], labels[early_stopping_indices], batch_size
+        ),
+        epochs=epochs,
+        callbacks=[tf.keras.callbacks.EarlyStopping(monitor="val_loss", patience=patience, restore_best_weights=True)],
+        verbose=0,
+    )
+
+    set_standardization_folded(model, mean, std)
+    loss, accuracy = model.evaluate(get_dataset(features[test_indices], labels[test_indices], batch_size), verbose=0)
+
+    return model, {
+        "wall_time_s": time.perf_counter() - start,
+        "epochs": len(history.history["val_loss"]),
+        "best_epoch": int(np.argmin(history.history["val_loss"])) + 1,
+        "loss": loss,
+        "accuracy": accuracy,
+        "train_row_count": len(fit_indices),
+        "early_stopping_row_count": len(early_stopping_indices),
+        "test_row_count": len(test_indices),
+    }
+
+
+def set_worker_threads(threads: int) -> None:
+    """process pool initializer, split the cores between the workers before tensorflow starts its thread pools"""
+    import tensorflow as tf
+
+    tf.config.threading.set_intra_op_parallelism_threads(threads)
+    tf.config.threading.set_inter_op_parallelism_threads(threads)
+
+
+def get_fold_result(fold_args: Tuple[int, np.ndarray, str, int, int, int, int]) -> Dict[str, float]:
+    """train and score one fold for a process pool, the features are read from the cache instead of being sent"""
+    fold, test_indices, cache_path, seed, epochs, patience, batch_size = fold_args
+    with np.load(cache_path) as training_data:
+        features, labels = training_data["features"], training_data["labels"]
+
+    train_indices = np.setdiff1d(np.arange(len(labels)), test_indices)
+    _, fold_result = fit(features, labels, train_indices, test_indices, seed + fold, epochs, patience, batch_size)
+
+    return {"fold": fold, "seed": seed + fold, **fold_result}
+
+
+def cross_validate(
+    file_format: str = "csv",
+    max_row: int = TRAINING_MAX_ROW,
+    folds: int = TRAINING_FOLDS,
+    processes: int = None,
+    seed: int = TRAINING_SEED,
+    epochs: int = TRAINING_EPOCHS,
+    patience: int = TRAINING_PATIENCE,
+    batch_size: int = TRAINING_BATCH_SIZE,
+    cache_path: str = TRAINING_CACHE_PATH,
+) -> List[Dict[str, float]]:
+    """stratified k-fold results, fold k is seeded with seed + k so the results do not depend on processes
+
+    folds run in spawned processes unless processes is None, tensorflow is never loaded before they start
+    """
+    _, labels = get_training_data(file_format, max_row, cache_path)
+    fold_args = [
+        (fold, test_indices, cache_path, seed, epochs, patience, batch_size)
+        for fold, test_indices in enumerate(get_stratified_folds(labels, folds, seed))
+    ]
+
+    if processes is None:
+        return list(map(get_fold_result, fold_args))
+
+    threads = max(1, (os.cpu_count() or 1) // processes)
+    with multiprocessing.get_context("spawn").Pool(processes, initializer=set_worker_threads, initargs=(threads,)) as pool:
+        return pool.map(get_fold_result, fold_args, chunksize=1)
+
+
+def get_cross_validation_summary(fold_results: List[Dict[str, float]]) -> Dict[str, float]:
+    """mean and standard deviation of the fold accuracies, epochs and wall times"""
+    summary = {"fold_count": len(fold_results)}
+    for key in ["accuracy", "loss", "epochs", "best_epoch", "wall_time_s"]:
+        values = np.array([fold_result[key] for fold_result in fold_results], dtype=float)
+        summary[f"{key}_mean"] = float(values.mean())
+        summary[f"{key}_std"] = float(values.std())
+
+    return summary
+
+
+def train(
+    save_path: str = KERAS_MODEL_PATH,
+    file_format: str = "csv",
+    max_row: int = TRAINING_MAX_ROW,
+    seed: int = TRAINING_SEED,
+    epochs: int = TRAINING_EPOCHS,
+    patience: int = TRAINING_PATIENCE,
+    batch_size: int = TRAINING_BATCH_SIZE,
+    validation_size: float = TRAINING_VALIDATION_SIZE,
+    npz_path: str = None,
+    cache_path: str = TRAINING_CACHE_PATH,
+) -> Dict[str, float]:
+    """train on a stratified split as model/tf.py does and save the model, and its npz export if npz_path is given"""
+    features, labels = get_training_data(file_format, max_row, cache_path)
+    train_indices, test_indices = get_stratified_split(labels, validation_size, seed)
+
+    model, result = fit(features, labels, train_indices, test_indices, seed, epochs, patience, batch_size)
+    model.save(save_path)
+    if npz_path is not None:
+        export_npz(save_path, npz_path)
+
+    return result
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="cross-validate and train the plot shape estimator")
+    parser.add_argument("--file-format", default="csv", choices=["csv", "parquet", "feather"])
+    parser.add_argument("--max-row", type=int, default=TRAINING_MAX_ROW, help="plots per label, 0 for all")
+    parser.add_argument("--folds", type=int, default=TRAINING_FOLDS, help="0 skips cross-validation")
+    parser.add_argument("--processes", type=int, default=None)
+    parser.add_argument("--seed", type=int, default=TRAINING_SEED)
+    parser.add_argument("--epochs", type=int, default=TRAINING_EPOCHS)
+    parser.add_argument("--patience", type=int, default=TRAINING_PATIENCE)
+    parser.add_argument("--batch-size", type=int, default=TRAINING_BATCH_SIZE)
+    parser.add_argument("--save-path", help="train on a stratified split and save the model, skipped if omitted")
+    parser.add_argument("--npz-path", help="also export the saved model to npz")
+    parser.add_argument("--report", help="json path of the results, stdout if omitted")
+    args = parser.parse_args()
+
+    max_row = None if args.max_row <= 0 else args.max_row
+    training_args = dict(seed=args.seed, epochs=args.epochs, patience=args.patience, batch_size=args.batch_size)
+
+    report = {"max_row": max_row, **training_args}
+    if args.folds > 1:
+        fold_results = cross_validate(args.file_format, max_row, args.folds, args.processes, **training_args)
+        report["folds"] = fold_results
+        report["summary"] = get_cross_validation_summary(fold_results)
+
+    if args.save_path is not None:
+        report["train"] = train(
+            args.save_path, args.file_format, max_row, npz_path=args.npz_path, **training_args
+        )
+
+    if args.report is None:
+        json.dump(report, sys.stdout, indent=2)
+    else:
+        with open(args.report, "w") as f:
+            json.dump(report, f, indent=2)
@@ -1,23 +1,127 @@
+from typing import List, Tuple, Union
 from debugvisualizer.debugvisualizer import Plotter
 from shapely.geometry import Polygon
-from data.plot_data import PlotData
-from utils.utils import ShapeLabel, get_cutted_mass
+from data.plot_data import PlotData, PlotDataBatch
+from data.feature_cache import FeatureCache
+from model.npz import NumpyEstimator, KERAS_MODEL_PATH, NPZ_MODEL_PATH
+from model.tflite import TFLiteEstimator, TFLITE_MODEL_PATH
+from utils.utils import ShapeLabel, FEATURE_COLUMNS, get_cutted_mass
+from utils.profiler import profiler
 
 from shapely.affinity import rotate, scale
 import shapely
-
-import tensorflow as tf
+import shapely.ops
 import numpy as np
 
 
 
 class PlotShapeEstimator:
     shape_label = [shape_label.name for shape_label in ShapeLabel]
-    estimator = tf.keras.models.load_model("model/plot-shape-estimator.pb")
+    backends = ["keras", "numpy", "tflite"]
+    model_path = KERAS_MODEL_PATH
+    npz_path = NPZ_MODEL_PATH
+    tflite_path = TFLITE_MODEL_PATH
+    batch_size = 4096
+    __estimators = {}
+    
+    def __init__(self, backend: str = "keras", estimator_path: str = None) -> None:
+        """estimator_path is a model of the backend's format, such as a pruned npz, the backend's default if None"""
+        if backend not in self.backends:
+            raise Exception(f"'{backend}' backend is not supported, use one of {self.backends}")
+        
+        self.backend = backend
+        self.estimator_path = estimator_path or self.__get_default_path(backend)
+        
+    def __enter__(self) -> "PlotShapeEstimator":
+        return self
+    
+    def __exit__(self, *_) -> None:
+        """end of an estimator session, prints the profiler summary when profiling is enabled"""
+        profiler.print_summary("PlotShapeEstimator")
+    
+    @property
+    def estimator(self):
+        """keras model, numpy or tflite estimator of the backend and path, loaded on the first prediction"""
+        if (self.backend, self.estimator_path) not in PlotShapeEstimator.__estimators:
+            self.warmup(self.backend, self.estimator_path)
+            
+        return PlotShapeEstimator.__estimators[self.backend, self.estimator_path]
+    
+    @classmethod
+    def warmup(cls, backend: str = "keras", estimator_path: str = None) -> None:
+        """load the backend's model and run a dummy prediction so the first real prediction pays no setup cost"""
+        estimator_path = estimator_path or cls.__get_default_path(backend)
+        if (backend, estimator_path) not in PlotShapeEstimator.__estimators:
+            if backend == "numpy":
+                estimator = NumpyEstimator(estimator_path)
+            elif backend == "tflite":
+                estimator = TFLiteEstimator(estimator_path)
+            else:
+                import tensorflow as tf
+                estimator = tf.keras.models.load_model(estimator_path)
+                
+            PlotShapeEstimator.__estimators[backend, estimator_path] = estimator
+        
+        PlotShapeEstimator.__estimators[backend, estimator_path].predict_on_batch(
+            np.zeros((1, len(FEATURE_COLUMNS)), dtype=np.float32)
+        )
+    
+    @classmethod
+    def __get_default_path(cls, backend: str) -> str:
+        return {"keras": cls.model_path, "numpy": cls.npz_path, "tflite": cls.tflite_path}[backend]
 
     def estimate(self, plot: PlotData) -> str:
         self.plot = plot
-        self.input_data = np.array(
+        self.input_data = self.__get_input_data([plot])
+        
+        with profiler.timer("predict"):
+            return self.shape_label[self.estimator.predict(self.input_data).argmax()]
+    
+    def estimate_many(
+        self, plots: Union[List[PlotData], PlotDataBatch], batch_size: int = None
+    ) -> Tuple[List[str], np.ndarray]:
+        """estimate plots' shape labels and per-class probabilities in input order"""
+        self.plots = plots
+        
+        return self.estimate_features(self.__get_input_data(plots), batch_size)
+    
+    def estimate_features(self, input_data: np.ndarray, batch_size: int = None) -> Tuple[List[str], np.ndarray]:
+        """estimate shape labels and per-class probabilities of a (n, 7) feature matrix in FEATURE_COLUMNS order"""
+        self.input_data = input_data
+        
+        probabilities = self.__predict(self.input_data, batch_size or self.batch_size)
+        shape_labels = [self.shape_label[li] for li in probabilities.argmax(axis=1)]
+        
+        return shape_labels, probabilities
+    
+    def estimate_geometries(
+        self, plot_geometries: List[Polygon], batch_size: int = None, cache: FeatureCache = None
+    ) -> Tuple[List[str], np.ndarray]:
+        """estimate plot geometries' shape labels and per-class probabilities in input order"""
+        return self.estimate_many([PlotData(plot_geometry, cache=cache) for plot_geometry in plot_geometries], batch_size)
+    
+    def __predict(self, input_data: np.ndarray, batch_size: int) -> np.ndarray:
+        """single forward pass per chunk of batch_size rows"""
+        rows, _ = input_data.shape
+        _, class_count = self.estimator.output_shape
+        if rows == 0:
+            return np.empty((0, class_count), dtype=np.float32)
+        
+        with profiler.timer("predict"):
+            return np.concatenate(
+                [
+                    np.asarray(self.estimator.predict_on_batch(input_data[bi : bi + batch_size]))
+                    for bi in range(0, rows, batch_size)
+                ]
+            )
+    
+    @staticmethod
+    def __get_input_data(plots: Union[List[PlotData], PlotDataBatch]) -> np.ndarray:
+        """stack plots' features in the model's input column order"""
+        if isinstance(plots, PlotDataBatch):
+            return plots.get_feature_matrix()
+        
+        return np.array(
             [
                 [
                     plot.is_flag,
@@ -28,10 +132,10 @@ class PlotShapeEstimator:
                     plot.plot_interior_angle_sum,
                     plot.plot_obb_ratio, 
                 ]
-            ]
-        )
-        
-        return self.shape_label[self.estimator.predict(self.input_data).argmax()]
+                for plot in plots
+            ],
+            dtype=np.float32,
+        ).reshape(-1, 7)
        
         
 if __name__ == "__main__":
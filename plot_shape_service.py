@@ -0,0 +1,264 @@
+from typing import Dict, Tuple
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from shapely.geometry import Polygon
+from plot_shape_estimator import PlotShapeEstimator
+from data.featurize import featurize_wkbs, get_feature_matrix
+
+import os
+import sys
+import json
+import time
+import asyncio
+import argparse
+import collections
+import shapely
+import numpy as np
+
+
+
+SERVICE_MAX_BATCH_SIZE = 256
+SERVICE_MAX_WAIT_MS = 5.0
+SERVICE_METRICS_WINDOW = 10000
+
+
+class PlotShapeService:
+    """asyncio micro-batching around PlotShapeEstimator
+
+    Concurrent estimate calls are queued and collected into batches of up to max_batch_size plots or max_wait_ms,
+    featurized in a worker pool and predicted in one batched call.
+    """
+
+    def __init__(
+        self,
+        estimator: PlotShapeEstimator = None,
+        max_batch_size: int = SERVICE_MAX_BATCH_SIZE,
+        max_wait_ms: float = SERVICE_MAX_WAIT_MS,
+        processes: int = None,
+    ) -> None:
+        if max_batch_size < 1:
+            raise Exception("'max_batch_size' must be positive")
+
+        self.estimator = PlotShapeEstimator() if estimator is None else estimator
+        self.max_batch_size = max_batch_size
+        self.max_wait_ms = max_wait_ms
+        self.processes = processes
+
+        self.__queue: asyncio.Queue = None
+        self.__worker: asyncio.Task = None
+        self.__is_stopping = False
+        self.__batch_tasks = set()
+        self.__batch_semaphore: asyncio.Semaphore = None
+        self.__featurize_executor: Executor = None
+        self.__predict_executor: Executor = None
+
+        self.__latencies = collections.deque(maxlen=SERVICE_METRICS_WINDOW)
+        self.__batch_sizes = collections.deque(maxlen=SERVICE_METRICS_WINDOW)
+        self.__request_count = 0
+        self.__error_count = 0
+
+    async def __aenter__(self) -> "PlotShapeService":
+        await self.start()
+        return self
+
+    async def __aexit__(self, *_) -> None:
+        await self.stop()
+
+    async def start(self) -> None:
+        """start the worker pools and the batching loop, the model is loaded before the first request"""
+        if self.__worker is not None:
+            return
+
+        loop = asyncio.get_running_loop()
+
+        # fork the featurization workers before the model is loaded in this process
+        if self.processes is None:
+            self.__featurize_executor = ThreadPoolExecutor(1)
+        else:
+            self.__featurize_executor = ProcessPoolExecutor(self.processes)
+            await loop.run_in_executor(self.__featurize_executor, os.getpid)
+
+        self.__predict_executor = ThreadPoolExecutor(1)
+        await loop.run_in_executor(
+            self.__predict_executor, self.estimator.warmup, self.estimator.backend, self.estimator.estimator_path
+        )
+
+        self.__queue = asyncio.Queue()
+        self.__is_stopping = False
+        self.__batch_semaphore = asyncio.Semaphore(1 if self.processes is None else self.processes)
+        self.__worker = asyncio.create_task(self.__run())
+
+    async def stop(self) -> None:
+        """finish the queued and running batches, then shut the worker pools down"""
+        if self.__worker is None:
+            return
+
+        # requests queued after the sentinel would never be taken, so new ones are refused from here on
+        self.__is_stopping = True
+
+        # the sentinel flushes the batch being collected and ends the batching loop
+        self.__queue.put_nowait(None)
+        await self.__worker
+        await asyncio.gather(*self.__batch_tasks, return_exceptions=True)
+
+        self.__featurize_executor.shutdown()
+        self.__predict_executor.shutdown()
+        self.__worker = None
+
+    async def estimate(self, plot_geometry: Polygon) -> Tuple[str, np.ndarray]:
+        """shape label and per-class probabilities of the plot geometry"""
+        if self.__worker is None:
+            raise Exception("'PlotShapeService' is not started")
+        if self.__is_stopping:
+            raise Exception("'PlotShapeService' is stopping")
+
+        future = asyncio.get_running_loop().create_future()
+        self.__queue.put_nowait((shapely.to_wkb(plot_geometry), future, time.perf_counter()))
+        self.__request_count += 1
+
+        return await future
+
+    def get_metrics(self) -> Dict[str, float]:
+        """queue depth, request counters, batch sizes and end-to-end latencies of the recent requests"""
+        latencies = np.array(self.__latencies) * 1000
+        batch_sizes = np.array(self.__batch_sizes)
+
+        return {
+            "queue_depth": 0 if self.__queue is None else self.__queue.qsize(),
+            "request_count": self.__request_count,
+            "error_count": self.__error_count,
+            "batch_count": len(batch_sizes),
+            "batch_size_mean": float(batch_sizes.mean()) if len(batch_sizes) else 0.0,
+            "latency_ms_p50": float(np.percentile(latencies, 50)) if len(latencies) else 0.0,
+            "latency_ms_p99": float(np.percentile(latencies, 99)) if len(latencies) else 0.0,
+            "latency_ms_max": float(latencies.max()) if len(latencies) else 0.0,
+        }
+
+    async def __run(self) -> None:
+        is_stopped = False
+        while not is_stopped:
+            batch = await self.__get_batch()
+            is_stopped = batch[-1] is None
+            batch = [request for request in batch if request is not None]
+            if not batch:
+                continue
+
+            await self.__batch_semaphore.acquire()
+            batch_task = asyncio.create_task(self.__estimate_batch(batch))
+            self.__batch_tasks.add(batch_task)
+            batch_task.add_done_callback(self.__batch_tasks.discard)
+            batch_task.add_done_callback(lambda _: self.__batch_semaphore.release())
+
+    async def __get_batch(self) -> list:
+        """wait for the first request, then collect until max_batch_size requests, max_wait_ms or the stop sentinel"""
+        loop = asyncio.get_running_loop()
+
+        batch = [await self.__queue.get()]
+        deadline = loop.time() + self.max_wait_ms / 1000
+
+        while len(batch) < self.max_batch_size and batch[-1] is not None:
+            if not self.__queue.empty():
+                batch.append(self.__queue.get_nowait())
+                continue
+
+            timeout = deadline - loop.time()
+            if timeout <= 0:
+                break
+
+            try:
+                batch.append(await asyncio.wait_for(self.__queue.get(), timeout))
+            except asyncio.TimeoutError:
+                break
+
+        return batch
+
+    async def __estimate_batch(self, batch: list) -> None:
+        loop = asyncio.get_running_loop()
+        plot_geometry_wkbs, futures, enqueued_times = zip(*batch)
+
+        try:
+            features = await loop.run_in_executor(self.__featurize_executor, featurize_wkbs, plot_geometry_wkbs)
+            is_valid = features["is_valid"]
+            shape_labels, probabilities = await loop.run_in_executor(
+                self.__predict_executor, self.estimator.estimate_features, get_feature_matrix(features)[is_valid]
+            )
+
+        except Exception as e:
+            for future in futures:
+                self.__set_exception(future, e)
+
+            self.__set_batch_finished(enqueued_times)
+            return
+
+        valid_indices = np.flatnonzero(is_valid)
+        for vi, pi in enumerate(valid_indices):
+            if not futures[pi].done():
+                futures[pi].set_result((shape_labels[vi], probabilities[vi]))
+
+        for pi in np.flatnonzero(~is_valid):
+            self.__set_exception(futures[pi], Exception(features["error"][pi]))
+
+        self.__set_batch_finished(enqueued_times)
+
+    def __set_batch_finished(self, enqueued_times: Tuple[float, ...]) -> None:
+        """record the batch size and the end-to-end latencies of its requests, failed ones included"""
+        finished_time = time.perf_counter()
+        self.__latencies.extend(finished_time - enqueued_time for enqueued_time in enqueued_times)
+        self.__batch_sizes.append(len(enqueued_times))
+
+    def __set_exception(self, future: asyncio.Future, exception: Exception) -> None:
+        """fail a pending request, requests already resolved or cancelled are not counted as errors"""
+        if not future.done():
+            self.__error_count += 1
+            future.set_exception(exception)
+
+
+async def serve_stdin(service: PlotShapeService) -> None:
+    """json lines front-end for testing, reads {"id": ..., "wkt": ...} and writes {"id": ..., "label": ...} per line"""
+    loop = asyncio.get_running_loop()
+
+    async def estimate_line(line: str) -> None:
+        request = {}
+        try:
+            request = json.loads(line)
+            shape_label, probabilities = await service.estimate(shapely.from_wkt(request["wkt"]))
+            response = {"id": request.get("id"), "label": shape_label, "probabilities": probabilities.tolist()}
+        except Exception as e:
+            response = {"id": request.get("id"), "error": str(e)}
+
+        print(json.dumps(response), flush=True)
+
+    line_tasks = []
+    while True:
+        line = await loop.run_in_executor(None, sys.stdin.readline)
+        if not line:
+            break
+
+        if line.strip():
+            line_tasks.append(asyncio.create_task(estimate_line(line)))
+
+    await asyncio.gather(*line_tasks)
+
+
+async def main(args: argparse.Namespace) -> None:
+    service = PlotShapeService(
+        PlotShapeEstimator(args.backend, args.estimator_path),
+        max_batch_size=args.max_batch_size,
+        max_wait_ms=args.max_wait_ms,
+        processes=args.processes,
+    )
+
+    async with service:
+        await serve_stdin(service)
+
+    print(json.dumps(service.get_metrics()), file=sys.stderr)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="micro-batching plot shape estimation over json lines on stdin")
+    parser.add_argument("--backend", default="keras", choices=PlotShapeEstimator.backends)
+    parser.add_argument("--estimator-path", help="model of the backend's format, the backend's default if omitted")
+    parser.add_argument("--max-batch-size", type=int, default=SERVICE_MAX_BATCH_SIZE)
+    parser.add_argument("--max-wait-ms", type=float, default=SERVICE_MAX_WAIT_MS)
+    parser.add_argument("--processes", type=int, default=None)
+
+    asyncio.run(main(parser.parse_args()))
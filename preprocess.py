@@ -1,22 +1,40 @@
-from enum import Enum
+from __future__ import annotations
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Set, Tuple, Union
 from debugvisualizer.debugvisualizer import Plotter
 from data.plot_data import PlotData
+from data.spatial_index import PlotSpatialIndex
 from utils.consts import Consts
-from utils.utils import ShapeLabel
+from utils.lazy_import import lazy_import
+from utils.profiler import profiler, ProgressReporter, StageStats
+from utils.plot_sheet import PLOT_SHEET_PAGE_SIZE, get_plot_sheet_paths, save_plot_sheet
+from utils.utils import (
+    ShapeLabel, 
+    Uaa, 
+    read_plot_data, 
+    write_plot_data, 
+    get_plot_data_geometries, 
+    get_plot_geometry_column, 
+    get_geometry_column_converted,
+)
 
-from shapely.geometry import Polygon, MultiPolygon
-from shapely import wkt
+from shapely.geometry import Polygon
+from shapely import ops
 
-import io
-import pandas
-import geopandas
+import glob
+import collections
+import decimal
+import itertools
+import hashlib
+import multiprocessing
 import json
 import math
 import os
 import csv
-import matplotlib.pyplot as plt
 import yaml
-from PIL import Image
+import ijson
+
+pandas = lazy_import("pandas")
+geopandas = lazy_import("geopandas")
 
 
 
@@ -25,118 +43,411 @@ SPLITTED_DATA_PATH = os.path.join(DATA_PATH, "splitted_data")
 PREPROCESSED_DATA_PATH = os.path.join(DATA_PATH, "preprocessed_data")
 END_DATA_PATH = os.path.join(DATA_PATH, "end_data")
 PREPROCESSED_DATA_MAX_ROW = 1000
+PREPROCESSED_DATA_FLUSH_ROW = 1000
+PREPROCESSED_DATA_COLUMNS = [
+    "plot_aspect_ratio",
+    "plot_obb_ratio",
+    "plot_interior_angle_sum",
+    "plot_label",
+    "plot_geometry_wkt",
+    "is_rectangle",
+    "is_flag",
+    "is_trapezoid",
+    "is_triangle",
+]
+PREPROCESSING_CHUNK_SIZE = 64
+PLOT_COLUMNS = ["PNU", "UEC", "UAA", "geometry"]
 SHAPE_LABELS = [shape_label.name for shape_label in ShapeLabel]
 
 
-class Uaa(Enum):
-    """plot usage"""
-    Plot = 8
-    Road = 11
+def get_decimal_converted(obj: Any) -> Any:
+    """ijson parses json numbers to Decimal, convert them to float recursively"""
+    if isinstance(obj, decimal.Decimal):
+        return float(obj)
+    if isinstance(obj, dict):
+        return {key: get_decimal_converted(value) for key, value in obj.items()}
+    if isinstance(obj, list):
+        return [get_decimal_converted(value) for value in obj]
+    
+    return obj
+
+
+def get_geojson_crs(geojson_path: str) -> Optional[str]:
+    """read only the FeatureCollection's crs name"""
+    with open(geojson_path, "rb") as f:
+        crs = next(ijson.items(f, "crs.properties.name"), None)
+        
+    return crs
+
+
+def iter_geojson_features(geojson_path: str) -> Iterator[dict]:
+    """stream FeatureCollection's features one by one without loading the whole file"""
+    with open(geojson_path, "rb") as f:
+        for feature in ijson.items(f, "features.item"):
+            yield get_decimal_converted(feature)
+
+
+def iter_geojson_batches(geojson_path: str, batch: int = 5000) -> Iterator[List[dict]]:
+    """stream FeatureCollection's features in lists of at most batch features"""
+    features = iter_geojson_features(geojson_path)
+    while True:
+        features_batch = list(itertools.islice(features, batch))
+        if len(features_batch) == 0:
+            return
+        
+        yield features_batch
+
+
+def iter_streamed_merged_plots(
+    geojson_path: str, batch: int = 5000, merge_errors: Dict[int, Exception] = None
+) -> Iterator[geopandas.GeoSeries]:
+    """merged plots of a streamed geojson, multi-part PNU fragments are held only until their group is complete"""
+    with open(geojson_path, "rb") as f:
+        part_counts = collections.Counter(ijson.items(f, "features.item.properties.PNU"))
+    
+    crs = get_geojson_crs(geojson_path)
+    pending_plots_data: Dict[str, List[geopandas.GeoDataFrame]] = collections.defaultdict(list)
+    
+    row_offset = 0
+    for features in iter_geojson_batches(geojson_path, batch):
+        plots_data = geopandas.GeoDataFrame.from_features(features, crs=crs)[PLOT_COLUMNS]
+        plots_data.index = pandas.RangeIndex(row_offset, row_offset + len(plots_data))
+        row_offset += len(plots_data)
+        
+        is_single_part = plots_data.PNU.map(part_counts) == 1
+        completed_plots_data = [plots_data[is_single_part]]
+        
+        for pnu, plot_data in plots_data[~is_single_part].groupby("PNU", sort=False):
+            pending_plots_data[pnu].append(plot_data)
+            if sum(map(len, pending_plots_data[pnu])) == part_counts[pnu]:
+                completed_plots_data.extend(pending_plots_data.pop(pnu))
+        
+        yield PlotDataPreprocessor.merge_plots(pandas.concat(completed_plots_data).sort_index(), merge_errors)
+
+
+def read_splitted_data(splitted_data_path: str) -> geopandas.GeoDataFrame:
+    """read one split_geojson shard with only the columns preprocessing needs"""
+    return geopandas.read_file(splitted_data_path)[PLOT_COLUMNS]
+
+
+def get_plot_data(
+    ri_and_plot_geometry: Tuple[int, Polygon]
+) -> Tuple[int, Optional[PlotData], Optional[Exception], Optional[Dict[str, StageStats]]]:
+    """PlotData for a process pool, with the exception instead of raising and the profiled stages of this call"""
+    ri, plot_geometry = ri_and_plot_geometry
+    try:
+        return ri, PlotData(plot_geometry=plot_geometry), None, profiler.pop_stages()
+    except Exception as e:
+        return ri, None, e, profiler.pop_stages()
+
+
+class PreprocessedDataWriter:
+    """buffered per-label csv, parquet or feather writer deduplicating rows by geometry wkt"""
+
+    def __init__(
+        self,
+        preprocessed_data_path: str = None,
+        max_row: int = PREPROCESSED_DATA_MAX_ROW,
+        flush_row: int = PREPROCESSED_DATA_FLUSH_ROW,
+        file_format: str = "csv",
+    ) -> None:
+        self.__preprocessed_data_path = PREPROCESSED_DATA_PATH if preprocessed_data_path is None else preprocessed_data_path
+        self.__max_row = max_row
+        self.__flush_row = flush_row
+        self.__file_format = file_format
+        
+        self.__buffers: Dict[str, List[list]] = {}
+        self.__plot_data_dfs: Dict[str, pandas.DataFrame] = {}
+        self.__row_counts: Dict[str, int] = {}
+        self.__row_hashes: Dict[str, Set[bytes]] = {}
+        self.__buffered_row_count = 0
+        
+    def write(self, plot_data: PlotData) -> bool:
+        """buffer plot_data's row unless its label is full or the geometry is already saved"""
+        shape_label = SHAPE_LABELS[plot_data.plot_label]
+        if shape_label not in self.__buffers:
+            self.__load(shape_label)
+        
+        row_hash = self.__get_row_hash(plot_data.plot_geometry.wkt)
+        if self.__row_counts[shape_label] >= self.__max_row or row_hash in self.__row_hashes[shape_label]:
+            return False
+        
+        self.__row_hashes[shape_label].add(row_hash)
+        self.__row_counts[shape_label] += 1
+        self.__buffers[shape_label].append(plot_data.all_plot_data)
+        
+        self.__buffered_row_count += 1
+        if self.__buffered_row_count >= self.__flush_row:
+            self.flush()
+            
+        return True
+    
+    @profiler.timed("write")
+    def flush(self) -> None:
+        """append all buffered rows in one write per label, binary formats are rewritten as a whole"""
+        for shape_label, rows in self.__buffers.items():
+            if len(rows) == 0:
+                continue
+            
+            plot_data_path = self.__get_plot_data_path(shape_label)
+            if self.__file_format == "csv":
+                with open(plot_data_path, "a", newline="") as f:
+                    writer = csv.writer(f, lineterminator="\n")
+                    writer.writerows(rows)
+            
+            else:
+                rows_df = pandas.DataFrame(rows, columns=PREPROCESSED_DATA_COLUMNS)
+                plot_data_df = self.__plot_data_dfs[shape_label]
+                if plot_data_df.shape[0] > 0:
+                    rows_df = pandas.concat([plot_data_df, rows_df], ignore_index=True)
+                
+                write_plot_data(rows_df, plot_data_path)
+                self.__plot_data_dfs[shape_label] = rows_df
+            
+            rows.clear()
+            
+        self.__buffered_row_count = 0
+    
+    def __load(self, shape_label: str) -> None:
+        """deduplicate the existing label file once and index its rows"""
+        plot_data_path = self.__get_plot_data_path(shape_label)
+        if not os.path.exists(plot_data_path):
+            write_plot_data(pandas.DataFrame(columns=PREPROCESSED_DATA_COLUMNS), plot_data_path)
+        
+        plot_data_df = read_plot_data(plot_data_path)
+        is_duplicated = plot_data_df.duplicated()
+        if is_duplicated.any():
+            plot_data_df = plot_data_df[~is_duplicated]
+            write_plot_data(plot_data_df, plot_data_path)
+        
+        plot_data_df = get_geometry_column_converted(plot_data_df, "plot_geometry_wkt")
+        
+        self.__buffers[shape_label] = []
+        self.__plot_data_dfs[shape_label] = plot_data_df
+        self.__row_counts[shape_label] = plot_data_df.shape[0]
+        # rows without a geometry cannot be duplicated by a new plot, so they are left out of the hashes
+        self.__row_hashes[shape_label] = set(map(self.__get_row_hash, plot_data_df.plot_geometry_wkt.dropna()))
+        
+    def __get_plot_data_path(self, shape_label: str) -> str:
+        return os.path.join(self.__preprocessed_data_path, f"{shape_label}.{self.__file_format}")
+    
+    @staticmethod
+    def __get_row_hash(plot_geometry_wkt: str) -> bytes:
+        return hashlib.blake2b(plot_geometry_wkt.encode(), digest_size=16).digest()
 
 
 class PlotDataPreprocessor:
     """raw plot data preprocessor"""
 
-    def __init__(self, plots_data: geopandas.GeoDataFrame) -> None:
-        self.__plots_data = plots_data.sort_values("UEC").reset_index(drop=True)
-        self.__reset_merged_plot()
+    def __init__(
+        self,
+        plots_data: geopandas.GeoDataFrame = None,
+        processes: int = None,
+        merged_plots: Iterable[geopandas.GeoSeries] = None,
+        keeps_plots_data: bool = True,
+        file_format: str = "csv",
+        merge_errors: Dict[int, Exception] = None,
+        computes_neighbour_features: bool = False,
+    ) -> None:
+        # PNU groups merged_plots failed to union, filled as they are merged and moved to plot_errors
+        self.__merge_errors = {} if merge_errors is None else merge_errors
+        
+        # road frontage and neighbour counts need the whole city's parcels, so streamed plots have none. no model
+        # column reads them yet, so the spatial join only runs on request
+        self.neighbour_features: Optional[pandas.DataFrame] = None
+        if plots_data is not None:
+            plots_data = plots_data.sort_values("UEC", kind="mergesort").reset_index(drop=True)
+            merged_plots = self.merge_plots(plots_data, self.__merge_errors)
+            if computes_neighbour_features:
+                self.neighbour_features = self.get_neighbour_features(plots_data, merged_plots)
+            merged_plots = [merged_plots]
+        
+        self.__merged_plots = merged_plots
+        self.__processes = processes
+        self.__keeps_plots_data = keeps_plots_data
+        self.__file_format = file_format
         self.__gen_preprocessed_data()
 
-    def __reset_merged_plot(self) -> None:
-        """merged separated plot polygon"""
-        self.__merged_plot = Polygon()
-        
-    def __save_data_to_csv(self, plot_data: PlotData) -> None:
-        """save object data to csv"""
+    @classmethod
+    def from_splitted_data(
+        cls,
+        splitted_data_path: str = SPLITTED_DATA_PATH,
+        processes: int = None,
+        file_format: str = "csv",
+        computes_neighbour_features: bool = False,
+    ) -> "PlotDataPreprocessor":
+        """read split_geojson shards across a process pool and preprocess them as one city"""
+        splitted_data_paths = sorted(
+            glob.glob(os.path.join(splitted_data_path, "gangnam-plots-*.geojson")),
+            key=lambda path: int(os.path.splitext(path)[0].split("-")[-1]),
+        )
         
-        csv_path = os.path.join(PREPROCESSED_DATA_PATH, SHAPE_LABELS[plot_data.plot_label] + ".csv")
-        csv_to_df = pandas.read_csv(csv_path)
-        csv_to_df.drop_duplicates(subset=None, inplace=True)
-        csv_to_df.to_csv(csv_path, index=False)
+        with multiprocessing.Pool(processes) as pool:
+            plots_data = pool.map(read_splitted_data, splitted_data_paths)
         
-        row_length, _ = csv_to_df.shape
-        if row_length < PREPROCESSED_DATA_MAX_ROW:
-            with open(csv_path, "a", newline="") as f:
-                writer = csv.writer(f)
-                row = plot_data.all_plot_data
-                writer.writerow(row)
-            
+        # PNU groups that straddle shards are merged by merge_plots over the concatenated city
+        return cls(
+            pandas.concat(plots_data, ignore_index=True),
+            processes=processes,
+            file_format=file_format,
+            computes_neighbour_features=computes_neighbour_features,
+        )
+    
+    @classmethod
+    def from_geojson_stream(
+        cls, geojson_path: str, batch: int = 5000, processes: int = None, file_format: str = "csv"
+    ) -> "PlotDataPreprocessor":
+        """preprocess a geojson streamed in batches of features with bounded memory, rows are saved in file order"""
+        merge_errors = {}
+        return cls(
+            processes=processes, 
+            merged_plots=iter_streamed_merged_plots(geojson_path, batch, merge_errors), 
+            keeps_plots_data=False,
+            file_format=file_format,
+            merge_errors=merge_errors,
+        )
+
     def __gen_preprocessed_data(self) -> None:
         """main func"""
         self.preprocessed_plots_data = []
-        raw_data = self.__plots_data 
-        rows, _ = raw_data.shape
-
-        ri = 0
-        is_needed_idx_add = False
-        while ri < rows - 1:            
-            try:
-                if is_needed_idx_add:
-                    ri += 1
-
-                uaa = raw_data.loc[ri].UAA
-                if uaa is None:
-                    is_needed_idx_add = True
-                    continue
-                
-                curr_pnu = raw_data.loc[ri].PNU
-                next_pnu = raw_data.loc[(ri + 1) % rows].PNU
-                prev_pnu = raw_data.loc[(ri - 1) % rows].PNU
-                geometry  = raw_data.loc[ri].geometry
-
-                is_needed_idx_add = False
-                if int(uaa) != Uaa.Plot.value:
-                    is_needed_idx_add = True
-                    continue
-                
-                if curr_pnu in (prev_pnu, next_pnu):
-                    self.__merged_plot = self.__merged_plot.union(geometry)
-                    is_needed_idx_add = True
-                    continue
-                
-                self.__merged_plot = geometry if self.__merged_plot.is_empty else self.__merged_plot
-                    
-                if (
-                    self.__is_satisfied_area_baseline(self.__merged_plot) 
-                    or isinstance(self.__merged_plot.simplify(Consts.TOLERANCE), MultiPolygon)
-                ):
-                    self.__reset_merged_plot()
-                    is_needed_idx_add = True
-                    continue
-                
-                plot_data = PlotData(plot_geometry=self.__merged_plot)
-                print(ri, "label:", SHAPE_LABELS[plot_data.plot_label])
-
+        self.plot_errors: Dict[int, str] = {}
+        self.__writer = PreprocessedDataWriter(file_format=self.__file_format)
+        self.__progress = ProgressReporter("PlotDataPreprocessor")
+        
+        try:
+            if self.__processes is None:
+                plots_data = map(get_plot_data, self.__gen_merged_plots())
+                self.__save_plots_data(plots_data)
+                return
+            
+            with multiprocessing.Pool(self.__processes) as pool:
+                plots_data = pool.imap(get_plot_data, self.__gen_merged_plots(), chunksize=PREPROCESSING_CHUNK_SIZE)
+                self.__save_plots_data(plots_data)
+        
+        finally:
+            self.__save_merge_errors()
+            self.__writer.flush()
+            self.__progress.report()
+            profiler.print_summary("PlotDataPreprocessor")
+            
+    def __save_plots_data(
+        self, plots_data: Iterable[Tuple[int, Optional[PlotData], Optional[Exception], Optional[Dict[str, StageStats]]]]
+    ) -> None:
+        """collect and save PlotData in merged plot order, failed rows are kept in plot_errors"""
+        for ri, plot_data, error, stages in plots_data:
+            self.__save_merge_errors()
+            profiler.merge(stages)
+            self.__progress.update(error)
+            
+            if plot_data is None:
+                self.plot_errors[ri] = f"{type(error).__name__}: {error}"
+                continue
+            
+            if self.__keeps_plots_data:
                 self.preprocessed_plots_data.append(plot_data)
-                self.__save_data_to_csv(plot_data)
                 
-                self.__reset_merged_plot()
-                is_needed_idx_add = True
+            self.__writer.write(plot_data)
             
+    def __save_merge_errors(self) -> None:
+        """count the PNU groups merged so far that failed to union and keep them in plot_errors by their first row
+        
+        streamed groups are merged while the pool feeds its workers, so they are taken here, in the saving thread
+        """
+        while self.__merge_errors:
+            ri, error = self.__merge_errors.popitem()
+            self.__progress.update(error)
+            self.plot_errors[ri] = f"{type(error).__name__}: {error}"
+            
+    def __gen_merged_plots(self) -> Iterator[Tuple[int, Polygon]]:
+        """yield merged plots to featurize in row order"""
+        for merged_plots in self.__merged_plots:
+            yield from zip(merged_plots.index, merged_plots)
+    
+    @staticmethod
+    def merge_plots(
+        plots_data: geopandas.GeoDataFrame, merge_errors: Dict[int, Exception] = None
+    ) -> geopandas.GeoSeries:
+        """dissolve Uaa.Plot parcels by PNU and keep merged plots satisfying the area and single polygon baseline
+        
+        PNU groups failing to union are dropped, and kept in merge_errors by their first row if it is given
+        """
+        uaa = pandas.to_numeric(plots_data.UAA, errors="coerce")
+        plots_data = plots_data[uaa == Uaa.Plot.value]
+        
+        # fragments of a PNU that fall into several touching groups would union to a MultiPolygon, which the single
+        # polygon baseline drops, so only PNUs whose fragments all touch are unioned
+        is_multi_part = plots_data.PNU.duplicated(keep=False)
+        multi_part_plots_data = plots_data[is_multi_part]
+        fragment_groups = PlotSpatialIndex(multi_part_plots_data).get_fragment_groups()
+        is_touching = pandas.Series(fragment_groups, index=multi_part_plots_data.index).groupby(
+            multi_part_plots_data.PNU.values
+        ).transform("nunique") == 1
+        
+        # one unary union per touching multi-part PNU, indexed by the group's first row
+        merged_geometries = {}
+        for pnu, geometries in multi_part_plots_data[is_touching].groupby("PNU", sort=False).geometry:
+            try:
+                merged_geometries[pnu] = ops.unary_union(list(geometries))
             except Exception as e:
-                self.__reset_merged_plot()
-                is_needed_idx_add = True
-                print("index:", ri, e)
+                if merge_errors is not None:
+                    merge_errors[geometries.index[0]] = e
+                merged_geometries[pnu] = None
+        
+        first_plots_data = plots_data.drop_duplicates("PNU")
+        merged_plots = geopandas.GeoSeries(
+            [
+                merged_geometries.get(pnu) if is_merged else geometry
+                for pnu, geometry, is_merged in zip(
+                    first_plots_data.PNU, first_plots_data.geometry, is_multi_part[first_plots_data.index]
+                )
+            ],
+            index=first_plots_data.index,
+            crs=plots_data.crs,
+        )
+        merged_plots = merged_plots[merged_plots.notna()]
+        
+        is_satisfied_baseline = ~PlotDataPreprocessor.__is_unsatisfied_area_baseline(merged_plots) & (
+            merged_plots.simplify(Consts.TOLERANCE).geom_type != "MultiPolygon"
+        )
+        
+        return merged_plots[is_satisfied_baseline]
+            
+    @staticmethod
+    @profiler.timed("neighbour_features")
+    def get_neighbour_features(plots_data: geopandas.GeoDataFrame, merged_plots: geopandas.GeoSeries) -> pandas.DataFrame:
+        """road frontage and neighbour counts of merged plots against all the city's parcels, indexed like merged_plots"""
+        spatial_index = PlotSpatialIndex(plots_data)
+        neighbour_features = spatial_index.get_neighbour_features(
+            merged_plots.values, plot_rows=plots_data.index.get_indexer(merged_plots.index)
+        )
+        neighbour_features.index = merged_plots.index
+        
+        return neighbour_features
             
-    def __is_satisfied_area_baseline(self, plot: Polygon) -> bool:
+    @staticmethod
+    def __is_unsatisfied_area_baseline(plots: geopandas.GeoSeries) -> pandas.Series:
         area_baseline_min = 100
         area_baseline_max = 400
         
-        return plot.area <= area_baseline_min or plot.area >= area_baseline_max
+        return (plots.area <= area_baseline_min) | (plots.area >= area_baseline_max)
     
     @staticmethod
-    def split_geojson(geojson_dict, batch=5000):
-        """geojson splitter"""
-        features = geojson_dict["features"]
-        split_count = math.ceil(len(features) / batch)
+    def split_geojson(geojson_dict: Union[dict, str], batch=5000):
+        """geojson splitter, a geojson path is streamed instead of loaded"""
+        if isinstance(geojson_dict, str):
+            features_batches = iter_geojson_batches(geojson_dict, batch)
+        else:
+            features = geojson_dict["features"]
+            split_count = math.ceil(len(features) / batch)
+            features_batches = (features[b * batch : (b+1) * batch] for b in range(split_count))
 
-        for b in range(split_count):
+        for b, features_batch in enumerate(features_batches):
             
             splitted_dict = {
             "type": "FeatureCollection",
             "name": f"gangnam-plots-{b}",
             "crs": { "type": "name", "properties": { "name": "urn:ogc:def:crs:EPSG::5174" } },
-            "features": features[b * batch : (b+1) * batch]
+            "features": features_batch
             }
             
             save_path = os.path.join(f"{SPLITTED_DATA_PATH}", splitted_dict["name"] + ".geojson")
@@ -144,74 +455,43 @@ class PlotDataPreprocessor:
                 json.dump(splitted_dict, f)
 
     @staticmethod
-    def merge_plot_image(preprocessed_data_path: str, path: str = None):
-        """save image from preprocessed plot data"""
-        shape_label = preprocessed_data_path.split(".")[0].split("\\")[-1]
+    def merge_plot_image(
+        preprocessed_data_path: str, path: str = None, processes: int = None, reports_progress: bool = True
+    ):
+        """save contact sheets of 25x40 plots from preprocessed plot data, one page per 1000 plots"""
+        shape_label = os.path.splitext(os.path.basename(preprocessed_data_path))[0]
         save_path = os.path.join(DATA_PATH, "QA", shape_label + ".png") if path is None else path
         if os.path.exists(save_path):
             return
-
-        def fig_to_img(figure):
-            """Convert a Matplotlib figure to a PIL Image and return it"""
-            buf = io.BytesIO()
-            figure.savefig(buf)
-            buf.seek(0)
-            image = Image.open(buf)
-
-            return image
         
-        preprocessed_data_df = pandas.read_csv(preprocessed_data_path)
-        preprocessed_data_geometries = preprocessed_data_df.plot_geometry_wkt
+        preprocessed_data_df = read_plot_data(
+            preprocessed_data_path, columns=[get_plot_geometry_column(preprocessed_data_path)]
+        )
+        preprocessed_data_geometries = get_plot_data_geometries(preprocessed_data_df)
         
-        dpi = 100
-        figsize = (3, 3)
-        col_num = 25
-        row_num = 40
-        img_size = figsize[0] * dpi
-        merged_image = Image.new("RGB", (col_num * img_size, row_num * img_size), "white")
+        # indices in the sheets stay the row indices of the data, as _InvalidShapes.yaml refers to them
+        start_indices = range(0, max(len(preprocessed_data_geometries), 1), PLOT_SHEET_PAGE_SIZE)
+        sheets = [
+            (preprocessed_data_geometries[si : si + PLOT_SHEET_PAGE_SIZE], si, sheet_path)
+            for si, sheet_path in zip(start_indices, get_plot_sheet_paths(save_path, len(start_indices)))
+        ]
         
-        current_cols = 0
-        output_height = 0
-        output_width = 0
-        color = "black"
+        progress = ProgressReporter(
+            "merge_plot_image", total=len(preprocessed_data_geometries), is_printed=reports_progress
+        )
         
-        for pi, plot_geometry_wkt in enumerate(preprocessed_data_geometries):
-            print(pi)
-
-            figure = plt.figure(figsize=figsize, dpi=dpi)
-            
-            ax = figure.add_subplot(1, 1, 1)
-            ax.axis("equal")
-            ax.set_axis_off()
-            
-            plot_geometry = wkt.loads(plot_geometry_wkt)
-            ax.plot(*plot_geometry.boundary.coords.xy, color=color, linewidth=0.6)
-            ax.fill(*plot_geometry.boundary.coords.xy, alpha=0.2, color=color)
-            plt.gcf().text(
-                0.5,
-                0.1,
-                f"index: {pi}",
-                va="center",
-                ha="center",
-                color="black",
-                fontsize=7,
-                )
-            
-            image = fig_to_img(figure)
-
-            merged_image.paste(image, (output_width, output_height))
-
-            current_cols += 1
-            if current_cols >= col_num:
-                output_width = 0
-                output_height += img_size
-                current_cols = 0
-            else:
-                output_width += img_size            
-            
-            plt.close(figure)
-
-        merged_image.save(save_path)
+        if processes is None or len(sheets) == 1:
+            for plot_count, stages in map(save_plot_sheet, sheets):
+                profiler.merge(stages)
+                progress.update(row_count=plot_count)
+        
+        else:
+            with multiprocessing.Pool(min(processes, len(sheets))) as pool:
+                for plot_count, stages in pool.imap(save_plot_sheet, sheets):
+                    profiler.merge(stages)
+                    progress.update(row_count=plot_count)
+        
+        progress.report()
 
         
 if __name__ == "__main__":
@@ -221,26 +501,27 @@ if __name__ == "__main__":
     #     save_path = os.path.join(PREPROCESSED_DATA_PATH, shape_label + ".csv")
     #     if not os.path.exists(save_path):
     #         f = open(save_path, 'w', newline="")
-    #         writer = csv.writer(f)
-    #         writer.writerow(
-    #             [
-    #                 "plot_aspect_ratio",
-    #                 "plot_obb_ratio",
-    #                 "plot_interior_angle_sum",
-    #                 "plot_label",
-    #                 "plot_geometry_wkt",
-    #                 "is_rectangle",
-    #                 "is_flag",
-    #                 "is_trapezoid",
-    #                 "is_triangle"
-    #             ]
-    #         )
+    #         writer = csv.writer(f, lineterminator="\n")
+    #         writer.writerow(PREPROCESSED_DATA_COLUMNS)
     
     #         f.close()
     
     """preprocessing"""
     # preprocessed_plots_data = PlotDataPreprocessor(geopandas.read_file("data/gangnam-plots-all.geojson"))
+    
+    """preprocessing streamed geojson with bounded memory"""
+    # preprocessed_plots_data = PlotDataPreprocessor.from_geojson_stream("data/gangnam-plots-all.geojson", processes=os.cpu_count())
+    
+    """preprocessing splitted data in parallel"""
+    # preprocessed_plots_data = PlotDataPreprocessor.from_splitted_data(processes=os.cpu_count())
 
+    """re-label with tuned Consts thresholds without redoing the geometry work"""
+    # from data.relabel import save_label_intermediates, relabel_plot_data
+    # merged_plots = PlotDataPreprocessor.merge_plots(geopandas.read_file("data/gangnam-plots-all.geojson"))
+    # save_label_intermediates(merged_plots, processes=os.cpu_count())
+    # Consts.FLAG_OBB_RATIO_BASELINE = 0.75
+    # relabelled_plots_data = relabel_plot_data()
+    
     """preprocessed data QA"""
     # for preprocessed_data in os.listdir(PREPROCESSED_DATA_PATH):
     #     preprocessed_data_path = os.path.join(PREPROCESSED_DATA_PATH, preprocessed_data)
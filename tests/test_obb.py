@@ -0,0 +1,44 @@
+from utils.utils import read_plot_data, get_plot_data_geometries, get_aspect_ratio, get_obb_ratio
+
+import utils.vectorized as vectorized
+
+import os
+import glob
+import pytest
+import shapely
+import numpy as np
+
+
+
+REPOSITORY_PATH = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+END_DATA_PATHS = sorted(glob.glob(os.path.join(REPOSITORY_PATH, "data", "end_data", "*.csv")))
+
+
+@pytest.mark.parametrize("end_data_path", END_DATA_PATHS, ids=os.path.basename)
+def test_end_data_obb_ratios(end_data_path: str) -> None:
+    """scalar and ragged obb ratios pick the same of several equal area rectangles as geos' oriented_envelope"""
+    plot_geometries = get_plot_data_geometries(read_plot_data(end_data_path))
+    plot_geometries = plot_geometries[~shapely.is_missing(plot_geometries)]
+
+    aspect_ratios = np.array([get_aspect_ratio(plot_geometry) for plot_geometry in plot_geometries])
+    obb_ratios = np.array([get_obb_ratio(plot_geometry) for plot_geometry in plot_geometries])
+
+    scalar_ratios = np.array(
+        [vectorized.get_aspect_ratio_and_obb_ratio(vectorized.get_ring_coords(g)) for g in plot_geometries]
+    )
+    mismatches = np.flatnonzero(
+        ~np.isclose(scalar_ratios[:, 0], aspect_ratios, rtol=1e-5) | ~np.isclose(scalar_ratios[:, 1], obb_ratios, rtol=1e-5)
+    )
+    assert len(mismatches) == 0, f"scalar obb ratios differ at rows {mismatches.tolist()}"
+
+    hull_coords, hull_index = vectorized.get_ragged_ring_coords(
+        shapely.get_exterior_ring(shapely.convex_hull(plot_geometries))
+    )
+    obb_widths, obb_heights = vectorized.get_ragged_obb_sides(hull_coords, hull_index, len(plot_geometries))
+    ragged_aspect_ratios = np.maximum(obb_widths, obb_heights) / np.minimum(obb_widths, obb_heights)
+    ragged_obb_ratios = shapely.area(plot_geometries) / (obb_widths * obb_heights)
+
+    mismatches = np.flatnonzero(
+        ~np.isclose(ragged_aspect_ratios, aspect_ratios, rtol=1e-5) | ~np.isclose(ragged_obb_ratios, obb_ratios, rtol=1e-5)
+    )
+    assert len(mismatches) == 0, f"ragged obb ratios differ at rows {mismatches.tolist()}"
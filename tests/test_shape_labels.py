@@ -0,0 +1,133 @@
+from typing import Optional, Tuple
+from shapely.geometry import Polygon, MultiPolygon, JOIN_STYLE
+from utils.consts import Consts
+from utils.utils import (
+    ShapeLabel,
+    read_plot_data,
+    get_plot_data_geometries,
+    get_estimated_shape_label,
+    get_interior_angle_sum,
+    get_obb_ratio,
+)
+
+import utils.vectorized as vectorized
+
+import os
+import glob
+import pytest
+import numpy as np
+
+
+
+REPOSITORY_PATH = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+END_DATA_PATHS = sorted(glob.glob(os.path.join(REPOSITORY_PATH, "data", "end_data", "*.csv")))
+
+
+def get_reference_shape_label(
+    input_poly: Polygon, obb_ratio: float, aspect_ratio: float, interior_angle_sum: float
+) -> Tuple[int, int, int, int, int]:
+    """get_estimated_shape_label as it was before its checkers were fused, every checker runs on every plot"""
+    is_satisfied_rectangle_obb_ratio = obb_ratio >= Consts.RECTANGLE_OBB_RATIO_BASELINE
+    is_rectangle = np.isclose(interior_angle_sum, Consts.RECTANGLE_ANGLE_SUM) and is_satisfied_rectangle_obb_ratio
+    is_lte_long_square_aspect_ratio_baseline = aspect_ratio <= Consts.LONG_SQUARE_SHAPE_ASPECT_RATIO_BASELINE
+
+    is_flag = False
+    flag_checker = input_poly.convex_hull - input_poly
+    if isinstance(flag_checker, Polygon) and not flag_checker.is_empty:
+        is_flag = (
+            np.isclose(get_interior_angle_sum(flag_checker), Consts.TRIANGLE_ANGLE_SUM)
+            and obb_ratio <= Consts.FLAG_OBB_RATIO_BASELINE
+        )
+
+    is_trapezoid = False
+    trapezoid_checker = (
+        input_poly.oriented_envelope - input_poly - input_poly.convex_hull
+    ).buffer(-Consts.TRAPEZOID_CHECKER_EROSION)
+
+    if isinstance(trapezoid_checker, MultiPolygon):
+        is_trapezoid = (
+            (len(trapezoid_checker.geoms) >= Consts.TRAPEZOID_CHECKER_TRIANGLE_COUNT)
+            and obb_ratio >= Consts.TRAPEZOID_OBB_RATIO_BASELINE
+        )
+    elif isinstance(trapezoid_checker, Polygon):
+        is_trapezoid = obb_ratio >= Consts.TRAPEZOID_OBB_RATIO_BASELINE
+
+    triangle_checker = input_poly.union(
+        trapezoid_checker.buffer(Consts.TRAPEZOID_CHECKER_EROSION + Consts.TOLERANCE, join_style=JOIN_STYLE.mitre)
+    )
+
+    is_triangle = (
+        np.isclose(get_interior_angle_sum(input_poly), Consts.TRIANGLE_ANGLE_SUM)
+        or get_obb_ratio(triangle_checker) >= Consts.TRIANGLE_OBB_RATIO_BASELINE
+    )
+
+    shape_label = ShapeLabel.UndefinedShape.value
+
+    if is_rectangle or is_satisfied_rectangle_obb_ratio and not is_rectangle:
+        shape_label = ShapeLabel.SquareShape.value if is_lte_long_square_aspect_ratio_baseline else ShapeLabel.LongSquareShape.value
+
+    elif is_flag:
+        shape_label = ShapeLabel.FlagShape.value
+
+    elif is_trapezoid:
+        shape_label = ShapeLabel.TrapezoidShape.value
+
+    elif is_triangle:
+        shape_label = ShapeLabel.TriangleShape.value
+
+    return shape_label, int(is_rectangle), int(is_flag), int(is_trapezoid), int(is_triangle)
+
+
+def get_labels_or_error(label_function, *label_args) -> Tuple[Optional[tuple], Optional[str]]:
+    """label and flags of label_function, or the exception it raised"""
+    try:
+        return tuple(int(value) for value in label_function(*label_args)), None
+    except Exception as e:
+        return None, f"{type(e).__name__}: {e}"
+
+
+@pytest.mark.parametrize("end_data_path", END_DATA_PATHS, ids=os.path.basename)
+def test_end_data_labels(end_data_path: str) -> None:
+    """fused scalar and vectorized labels and flags of every end data row match the pre-fusion labelling
+
+    rows with a stored plot_label were accepted by preprocessing, so neither labelling may raise on them. other rows
+    the pre-fusion labelling raises on, which preprocessing rejects, must raise in the scalar version too
+    """
+    plot_data_df = read_plot_data(end_data_path)
+    plot_geometries = get_plot_data_geometries(plot_data_df)
+    obb_ratios = plot_data_df.plot_obb_ratio.to_numpy()
+    aspect_ratios = plot_data_df.plot_aspect_ratio.to_numpy()
+    interior_angle_sums = plot_data_df.plot_interior_angle_sum.to_numpy()
+
+    label_args = list(zip(plot_geometries, obb_ratios, aspect_ratios, interior_angle_sums))
+    reference_results = [get_labels_or_error(get_reference_shape_label, *args) for args in label_args]
+    scalar_results = [get_labels_or_error(get_estimated_shape_label, *args) for args in label_args]
+
+    has_stored_label = plot_data_df.plot_label.notna().to_numpy()
+    errors = {
+        int(ri): reference_results[ri][1] or scalar_results[ri][1]
+        for ri in np.flatnonzero(has_stored_label)
+        if reference_results[ri][1] is not None or scalar_results[ri][1] is not None
+    }
+    assert len(errors) == 0, f"labelling raised on stored rows {errors}"
+
+    mismatches = [
+        ri
+        for ri, (reference_result, scalar_result) in enumerate(zip(reference_results, scalar_results))
+        if reference_result[0] != scalar_result[0] or (reference_result[1] is None) != (scalar_result[1] is None)
+    ]
+    assert len(mismatches) == 0, f"scalar labels differ at rows {mismatches}"
+
+    is_labelled = np.array([labels is not None for labels, _ in reference_results], dtype=bool)
+    reference_labels = np.array([labels for labels, _ in reference_results if labels is not None]).reshape(-1, 5)
+    vectorized_labels = np.column_stack(
+        vectorized.get_estimated_shape_labels(
+            plot_geometries[is_labelled],
+            obb_ratios[is_labelled],
+            aspect_ratios[is_labelled],
+            interior_angle_sums[is_labelled],
+        )
+    )
+
+    mismatches = np.flatnonzero(is_labelled)[(vectorized_labels != reference_labels).any(axis=1)]
+    assert len(mismatches) == 0, f"vectorized labels differ at rows {mismatches.tolist()}"
@@ -0,0 +1,50 @@
+from typing import List, Tuple
+
+import utils.vectorized as vectorized
+
+import pytest
+import numpy as np
+
+
+
+SQUARE_COORDS = [(4, 0), (4, 4), (0, 4), (0, 0)]
+
+# a spike going up from the top edge and turning back halfway down its own segment
+TURN_BACK_SPIKE_COORDS = [(0, 0), (4, 0), (4, 4), (2, 4), (2, 6), (2, 5), (0, 4)]
+
+# the ring passes through (2, 2) twice, the two triangles touch at that vertex only
+SELF_TOUCHING_COORDS = [(0, 0), (4, 0), (2, 2), (4, 4), (0, 4), (2, 2)]
+
+
+@pytest.mark.parametrize(
+    "coords, expected_coords",
+    [
+        # first vertex on the bottom run, the last segment is merged with the first one
+        ([(2, 0), (4, 0), (4, 2), (4, 4), (0, 4), (0, 0)], SQUARE_COORDS),
+        # first and last vertices on the bottom run, the last segment is merged with both of its neighbours
+        ([(2, 0), (4, 0), (4, 4), (0, 4), (0, 0), (1, 0)], SQUARE_COORDS),
+        # the spike's returning segment has the same slope as its outgoing one, so they merge into a stub
+        (TURN_BACK_SPIKE_COORDS, [(0, 0), (4, 0), (4, 4), (2, 4), (2, 5), (0, 4)]),
+    ],
+    ids=["first-vertex-on-run", "first-and-last-vertex-on-run", "turn-back-spike"],
+)
+def test_collinear_removed_coords(coords: List[Tuple[float, float]], expected_coords: List[Tuple[float, float]]) -> None:
+    """same slope runs are merged in the segment merge loop's order, starting vertices included"""
+    collinear_removed_coords = vectorized.get_collinear_removed_coords(np.array(coords, dtype=float))
+
+    assert collinear_removed_coords.tolist() == np.array(expected_coords, dtype=float).tolist()
+
+
+@pytest.mark.parametrize(
+    "coords, expected_is_simple",
+    [
+        (SQUARE_COORDS, True),
+        ([(0, 0), (4, 0), (4, 4), (2, 4), (2, 5), (0, 4)], True),
+        (TURN_BACK_SPIKE_COORDS, False),
+        (SELF_TOUCHING_COORDS, False),
+    ],
+    ids=["square", "spike-stub", "turn-back-spike", "self-touching-vertex"],
+)
+def test_is_simple_ring(coords: List[Tuple[float, float]], expected_is_simple: bool) -> None:
+    """turned back segments and non-consecutive segments sharing a point are not simple"""
+    assert vectorized.get_is_simple_ring(np.array(coords, dtype=float)) == expected_is_simple
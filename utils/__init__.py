@@ -1 +1 @@
-all = ["consts", "utils"]
\ No newline at end of file
+all = ["consts", "utils", "vectorized", "lazy_import", "profiler", "plot_sheet"]
\ No newline at end of file
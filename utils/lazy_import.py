@@ -0,0 +1,21 @@
+from types import ModuleType
+
+import sys
+import importlib.util
+
+
+
+def lazy_import(name: str) -> ModuleType:
+    """module which is executed on its first attribute access instead of at import time"""
+    if name in sys.modules:
+        return sys.modules[name]
+
+    spec = importlib.util.find_spec(name)
+    loader = importlib.util.LazyLoader(spec.loader)
+    spec.loader = loader
+
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[name] = module
+    loader.exec_module(module)
+
+    return module
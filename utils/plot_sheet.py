@@ -0,0 +1,113 @@
+from typing import Dict, List, Optional, Tuple
+from utils.profiler import profiler, StageStats
+
+import os
+import shapely
+import numpy as np
+
+
+
+PLOT_SHEET_COLUMNS = 25
+PLOT_SHEET_ROWS = 40
+PLOT_SHEET_PAGE_SIZE = PLOT_SHEET_COLUMNS * PLOT_SHEET_ROWS
+PLOT_SHEET_CELL_SIZE = 300
+
+# left, top, right and bottom of the axes in a cell, as the former 3x3 inch, 100 dpi matplotlib figure laid them out
+PLOT_SHEET_AXES_BOX = (37.5, 36.0, 270.0, 267.0)
+PLOT_SHEET_AXES_MARGIN = 0.05
+PLOT_SHEET_LABEL_Y = 270
+PLOT_SHEET_LABEL_FONT_SIZE = 10
+# grayscale sheets, the plots are only ever drawn in gray and black on white
+PLOT_SHEET_MODE = "L"
+PLOT_SHEET_BACKGROUND_COLOR = 255
+PLOT_SHEET_FILL_COLOR = 204
+PLOT_SHEET_LINE_COLOR = 0
+
+
+def get_plot_sheet_paths(save_path: str, page_count: int) -> List[str]:
+    """save_path for the first page and save_path suffixed with the page number for the following pages"""
+    root, ext = os.path.splitext(save_path)
+    return [save_path] + [f"{root}_{page}{ext}" for page in range(1, page_count)]
+
+
+def get_cell_geometries(plot_geometries: np.ndarray) -> np.ndarray:
+    """plot geometries fitted into their sheet cell's axes box with equal aspect and the y axis flipped"""
+    plot_geometries = np.array(plot_geometries, dtype=object)
+
+    minx, miny, maxx, maxy = shapely.bounds(plot_geometries).T
+    width = np.maximum(maxx - minx, np.finfo(float).eps) * (1 + 2 * PLOT_SHEET_AXES_MARGIN)
+    height = np.maximum(maxy - miny, np.finfo(float).eps) * (1 + 2 * PLOT_SHEET_AXES_MARGIN)
+
+    left, top, right, bottom = PLOT_SHEET_AXES_BOX
+    scale = np.minimum((right - left) / width, (bottom - top) / height)
+
+    cell_indices = np.arange(len(plot_geometries))
+    cell_center_x = (cell_indices % PLOT_SHEET_COLUMNS) * PLOT_SHEET_CELL_SIZE + (left + right) / 2
+    cell_center_y = (cell_indices // PLOT_SHEET_COLUMNS) * PLOT_SHEET_CELL_SIZE + (top + bottom) / 2
+
+    coords, gi = shapely.get_coordinates(plot_geometries, return_index=True)
+    cell_coords = np.column_stack(
+        [
+            (coords[:, 0] - (minx + maxx)[gi] / 2) * scale[gi] + cell_center_x[gi],
+            cell_center_y[gi] - (coords[:, 1] - (miny + maxy)[gi] / 2) * scale[gi],
+        ]
+    )
+
+    return shapely.set_coordinates(plot_geometries, cell_coords)
+
+
+def get_plot_sheet_image(plot_geometries: np.ndarray, start_index: int = 0) -> "PIL.Image.Image":
+    """one sheet of up to PLOT_SHEET_PAGE_SIZE filled plot outlines, each labelled with its index in the data"""
+    from PIL import Image, ImageDraw, ImageFont
+    from matplotlib import font_manager
+
+    if len(plot_geometries) > PLOT_SHEET_PAGE_SIZE:
+        raise Exception(f"'plot_geometries' must be at most {PLOT_SHEET_PAGE_SIZE} per sheet")
+
+    image = Image.new(
+        PLOT_SHEET_MODE,
+        (PLOT_SHEET_COLUMNS * PLOT_SHEET_CELL_SIZE, PLOT_SHEET_ROWS * PLOT_SHEET_CELL_SIZE),
+        PLOT_SHEET_BACKGROUND_COLOR,
+    )
+    draw = ImageDraw.Draw(image)
+    font = ImageFont.truetype(font_manager.findfont("DejaVu Sans"), PLOT_SHEET_LABEL_FONT_SIZE)
+
+    for ci, cell_geometry in enumerate(get_cell_geometries(plot_geometries)):
+        if cell_geometry is not None:
+            for polygon in shapely.get_parts(cell_geometry):
+                if not isinstance(polygon, shapely.Polygon) or polygon.is_empty:
+                    continue
+
+                rings = [list(polygon.exterior.coords)] + [list(interior.coords) for interior in polygon.interiors]
+                draw.polygon(rings[0], fill=PLOT_SHEET_FILL_COLOR)
+                for ring in rings[1:]:
+                    draw.polygon(ring, fill=PLOT_SHEET_BACKGROUND_COLOR)
+                for ring in rings:
+                    draw.line(ring, fill=PLOT_SHEET_LINE_COLOR, width=1)
+
+        draw.text(
+            (
+                (ci % PLOT_SHEET_COLUMNS + 0.5) * PLOT_SHEET_CELL_SIZE,
+                (ci // PLOT_SHEET_COLUMNS) * PLOT_SHEET_CELL_SIZE + PLOT_SHEET_LABEL_Y,
+            ),
+            f"index: {start_index + ci}",
+            fill=PLOT_SHEET_LINE_COLOR,
+            font=font,
+            anchor="mm",
+        )
+
+    return image
+
+
+def save_plot_sheet(
+    plot_geometries_and_start_index_and_save_path: Tuple[np.ndarray, int, str]
+) -> Tuple[int, Optional[Dict[str, StageStats]]]:
+    """render and save one sheet for a process pool, with the number of plots and the profiled stages of this call"""
+    plot_geometries, start_index, save_path = plot_geometries_and_start_index_and_save_path
+    with profiler.timer("render"):
+        image = get_plot_sheet_image(plot_geometries, start_index)
+
+    with profiler.timer("encode"):
+        image.save(save_path)
+
+    return len(plot_geometries), profiler.pop_stages()
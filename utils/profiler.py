@@ -0,0 +1,188 @@
+from typing import Callable, Dict, Optional
+
+import os
+import time
+import bisect
+import functools
+import contextlib
+
+
+
+# upper edges of latency histogram buckets in milliseconds, the last bucket is open
+PROFILER_HISTOGRAM_EDGES_MS = [0.01, 0.1, 1, 10, 100, 1000]
+PROFILER_ENV = "PLOT_SHAPE_PROFILE"
+PROGRESS_INTERVAL_S = 5.0
+
+NULL_TIMER = contextlib.nullcontext()
+
+
+class StageStats:
+    """call count, total and extreme latencies and latency histogram of a stage"""
+    __slots__ = ("count", "total_s", "min_s", "max_s", "histogram")
+
+    def __init__(self) -> None:
+        self.count = 0
+        self.total_s = 0.0
+        self.min_s = float("inf")
+        self.max_s = 0.0
+        self.histogram = [0] * (len(PROFILER_HISTOGRAM_EDGES_MS) + 1)
+
+    def add(self, elapsed_s: float) -> None:
+        self.count += 1
+        self.total_s += elapsed_s
+        self.min_s = min(self.min_s, elapsed_s)
+        self.max_s = max(self.max_s, elapsed_s)
+        self.histogram[bisect.bisect_left(PROFILER_HISTOGRAM_EDGES_MS, elapsed_s * 1000)] += 1
+
+    def merge(self, other: "StageStats") -> None:
+        self.count += other.count
+        self.total_s += other.total_s
+        self.min_s = min(self.min_s, other.min_s)
+        self.max_s = max(self.max_s, other.max_s)
+        self.histogram = [count + other_count for count, other_count in zip(self.histogram, other.histogram)]
+
+
+class Profiler:
+    """switchable per-stage timers, disabled timers cost one attribute check
+
+    enabled by Profiler.enable() or the PLOT_SHAPE_PROFILE=1 environment variable, which forked workers inherit
+    """
+
+    def __init__(self) -> None:
+        self.is_enabled = os.environ.get(PROFILER_ENV) == "1"
+        self.stages: Dict[str, StageStats] = {}
+
+    def enable(self) -> None:
+        self.is_enabled = True
+
+    def disable(self) -> None:
+        self.is_enabled = False
+
+    def reset(self) -> None:
+        self.stages = {}
+
+    def record(self, stage: str, elapsed_s: float) -> None:
+        if stage not in self.stages:
+            self.stages[stage] = StageStats()
+
+        self.stages[stage].add(elapsed_s)
+
+    @contextlib.contextmanager
+    def __timer(self, stage: str):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(stage, time.perf_counter() - start)
+
+    def timer(self, stage: str):
+        """context manager timing its body as stage"""
+        if not self.is_enabled:
+            return NULL_TIMER
+
+        return self.__timer(stage)
+
+    def timed(self, stage: str) -> Callable:
+        """decorator timing every call of the function as stage"""
+        def decorator(function: Callable) -> Callable:
+            @functools.wraps(function)
+            def wrapper(*args, **kwargs):
+                if not self.is_enabled:
+                    return function(*args, **kwargs)
+
+                with self.__timer(stage):
+                    return function(*args, **kwargs)
+
+            return wrapper
+
+        return decorator
+
+    def pop_stages(self) -> Optional[Dict[str, StageStats]]:
+        """stages recorded since the last pop, None if disabled, for sending worker timings to the parent"""
+        if not self.is_enabled:
+            return None
+
+        stages, self.stages = self.stages, {}
+        return stages
+
+    def merge(self, stages: Optional[Dict[str, StageStats]]) -> None:
+        """add stages popped in a worker process"""
+        for stage, stats in (stages or {}).items():
+            if stage not in self.stages:
+                self.stages[stage] = StageStats()
+
+            self.stages[stage].merge(stats)
+
+    def get_summary(self) -> Dict[str, dict]:
+        """per stage count, total, mean, min, max and histogram keyed by bucket upper edge"""
+        bucket_names = [f"<={edge}ms" for edge in PROFILER_HISTOGRAM_EDGES_MS] + [f">{PROFILER_HISTOGRAM_EDGES_MS[-1]}ms"]
+        return {
+            stage: {
+                "count": stats.count,
+                "total_s": stats.total_s,
+                "mean_ms": stats.total_s / stats.count * 1000,
+                "min_ms": stats.min_s * 1000,
+                "max_ms": stats.max_s * 1000,
+                "histogram": dict(zip(bucket_names, stats.histogram)),
+            }
+            for stage, stats in sorted(self.stages.items(), key=lambda item: -item[1].total_s)
+        }
+
+    def print_summary(self, title: str = "profile") -> None:
+        """stage table sorted by total time, nothing if disabled"""
+        if not self.is_enabled:
+            return
+
+        print(f"[{title}]")
+        print(f"{'stage':<24}{'count':>10}{'total_s':>12}{'mean_ms':>12}{'max_ms':>12}")
+        for stage, summary in self.get_summary().items():
+            print(
+                f"{stage:<24}{summary['count']:>10}{summary['total_s']:>12.3f}"
+                f"{summary['mean_ms']:>12.3f}{summary['max_ms']:>12.3f}"
+            )
+
+
+class ProgressReporter:
+    """rate-limited progress of rows, rows per second and exception counts by type"""
+
+    def __init__(
+        self, title: str, total: int = None, interval_s: float = PROGRESS_INTERVAL_S, is_printed: bool = True
+    ) -> None:
+        self.title = title
+        self.total = total
+        self.interval_s = interval_s
+        self.is_printed = is_printed
+        self.row_count = 0
+        self.error_counts: Dict[str, int] = {}
+
+        self.__start = time.perf_counter()
+        self.__last_report = self.__start
+
+    def update(self, error: Exception = None, row_count: int = 1) -> None:
+        self.row_count += row_count
+        if error is not None:
+            error_type = type(error).__name__
+            self.error_counts[error_type] = self.error_counts.get(error_type, 0) + 1
+
+        now = time.perf_counter()
+        if now - self.__last_report >= self.interval_s:
+            self.__last_report = now
+            self.report()
+
+    def report(self) -> None:
+        """print the progress line, rows and errors are still counted when is_printed is off"""
+        if not self.is_printed:
+            return
+
+        elapsed_s = time.perf_counter() - self.__start
+        rows_per_s = self.row_count / elapsed_s if elapsed_s > 0 else 0.0
+        total = "" if self.total is None else f"/{self.total}"
+        errors = ", ".join(f"{error_type}: {count}" for error_type, count in sorted(self.error_counts.items()))
+
+        print(
+            f"[{self.title}] rows {self.row_count}{total}, {rows_per_s:.1f} rows/s, errors {{{errors}}}",
+            flush=True,
+        )
+
+
+profiler = Profiler()
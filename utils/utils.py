@@ -1,14 +1,20 @@
+from __future__ import annotations
 from enum import Enum, auto
 from typing import List, Tuple
 from utils.consts import Consts
 from debugvisualizer.debugvisualizer import Plotter
 from shapely.geometry import Polygon, MultiPolygon, LineString, MultiPoint, JOIN_STYLE
-from shapely import ops
+from utils.lazy_import import lazy_import
+from utils.profiler import profiler
 
+import os
 import shapely
-import pandas
+import shapely.ops
 import numpy as np
 
+pandas = lazy_import("pandas")
+vectorized = lazy_import("utils.vectorized")
+
 
 
 class ShapeLabel(Enum):
@@ -19,6 +25,26 @@ class ShapeLabel(Enum):
     TriangleShape = auto()
     TrapezoidShape = auto()
     UndefinedShape = auto()
+
+
+class Uaa(Enum):
+    """plot usage"""
+    Plot = 8
+    Road = 11
+
+
+# model input column order
+FEATURE_COLUMNS = [
+    "is_flag",
+    "is_rectangle",
+    "is_trapezoid",
+    "is_triangle",
+    "plot_aspect_ratio",
+    "plot_interior_angle_sum",
+    "plot_obb_ratio",
+]
+
+PLOT_DATA_FORMATS = ["csv", "parquet", "feather"]
     
 
 def get_exploded_linestring(input_linestring: LineString) -> List[LineString]:
@@ -45,67 +71,17 @@ def get_obb_ratio(input_poly: Polygon) -> float:
     return input_poly.area / input_poly.oriented_envelope.area
 
 
-def get_linestring_slope(input_linestring: LineString) -> float:
-    """get input liestring's slope"""
-    x1, x2 = np.array(input_linestring.coords)[:, 0]
-    y1, y2 = np.array(input_linestring.coords)[:, 1]
-    
-    slope = np.inf if np.isclose(x2 - x1, 0) else (y2 - y1) / (x2 - x1) 
-    return slope
-
-
-def get_list_of_linestring_vertices(input_linestring: List[LineString]) -> List[Tuple[float]]:
-    """convert list of linestring to list of vertices"""
-    return [l.coords[0] for l in input_linestring]
-
-
+@profiler.timed("simplification")
 def get_simplified_polygon(input_poly: Polygon) -> Polygon:
     """get simplified polygon"""
-    exploded_input_poly = get_exploded_linestring(input_poly.boundary.simplify(Consts.TOLERANCE))
-    
-    simplified: List[LineString]
-    simplified = [exploded_input_poly[0]]
+    simplified_coords = vectorized.get_collinear_removed_coords(
+        np.asarray(input_poly.boundary.simplify(Consts.TOLERANCE).coords, dtype=float)[:-1, :2]
+    )
     
-    si = 0
-    while si < len(exploded_input_poly):
-        curr_segment = exploded_input_poly[si]
-        prev_segment = simplified[-1]
-        next_segment = simplified[0]
-        
-        is_last_si = si == len(exploded_input_poly) - 1
-        
-        is_needed_merge_curr_and_prev = (
-            np.isclose(get_linestring_slope(curr_segment), get_linestring_slope(prev_segment), atol=Consts.TOLERANCE_SLOPE) 
-            and not curr_segment.disjoint(prev_segment)
-        )
-        
-        is_needed_merge_curr_and_next = (
-            np.isclose(get_linestring_slope(curr_segment), get_linestring_slope(next_segment), atol=Consts.TOLERANCE_SLOPE) 
-            and not curr_segment.disjoint(next_segment)
-            and is_last_si
-        )
-        
-        if is_needed_merge_curr_and_prev and is_needed_merge_curr_and_next:
-            simplified.append(LineString([simplified[-1].coords[0], simplified[0].coords[-1]]))
-            del simplified[0]
-            del simplified[-2]
-
-        elif is_needed_merge_curr_and_prev:
-            simplified[-1] = LineString([prev_segment.coords[0], curr_segment.coords[-1]])
-            
-        elif is_needed_merge_curr_and_next:
-            simplified.append(LineString([curr_segment.coords[0], next_segment.coords[-1]]))
-            del simplified[0]
-            
-        else:
-            simplified.append(curr_segment)
-        
-        si += 1
-        
-    if not ops.linemerge(simplified).is_simple:
+    if not vectorized.get_is_simple_ring(simplified_coords):
         raise Exception("'simplified' is self-intersecting geometry")
     
-    return Polygon(get_list_of_linestring_vertices(simplified))
+    return Polygon(simplified_coords)
 
 
 def get_longest_segment(input_poly: Polygon) -> LineString:
@@ -146,41 +122,47 @@ def get_interior_angle_sum(input_poly: Polygon) -> float:
 
 
 def get_estimated_shape_label(input_poly: Polygon, obb_ratio: float, aspect_ratio: float, interior_angle_sum: float) -> int:
-    """get estimated input polygon's shape label"""
+    """get estimated input polygon's shape label, convex hull and obb are computed once and shared by the checkers"""
     is_satisfied_rectangle_obb_ratio = obb_ratio >= Consts.RECTANGLE_OBB_RATIO_BASELINE
     is_rectangle = np.isclose(interior_angle_sum, Consts.RECTANGLE_ANGLE_SUM) and is_satisfied_rectangle_obb_ratio
     is_lte_long_square_aspect_ratio_baseline = aspect_ratio <= Consts.LONG_SQUARE_SHAPE_ASPECT_RATIO_BASELINE
     
+    convex_hull = input_poly.convex_hull
     
+    # every flag is a model input, so only checkers whose own result is already decided are skipped. the flag
+    # checker's angle sum raises on degenerate checkers, which rejects the plot, so it runs at any obb ratio
     is_flag = False
-    flag_checker = input_poly.convex_hull - input_poly
-    if isinstance(flag_checker, Polygon) and not flag_checker.is_empty:
-        is_flag = (
-            np.isclose(get_interior_angle_sum(flag_checker), Consts.TRIANGLE_ANGLE_SUM) 
-            and obb_ratio <= Consts.FLAG_OBB_RATIO_BASELINE
-        )
-        
+    with profiler.timer("flag_check"):
+        flag_checker = convex_hull - input_poly
+        if isinstance(flag_checker, Polygon) and not flag_checker.is_empty:
+            is_flag = (
+                np.isclose(get_interior_angle_sum(flag_checker), Consts.TRIANGLE_ANGLE_SUM)
+                and obb_ratio <= Consts.FLAG_OBB_RATIO_BASELINE
+            )
+    
+    is_triangle = np.isclose(interior_angle_sum, Consts.TRIANGLE_ANGLE_SUM)
+    is_satisfied_trapezoid_obb_ratio = obb_ratio >= Consts.TRAPEZOID_OBB_RATIO_BASELINE
+    
     is_trapezoid = False
-    trapezoid_checker = (
-        input_poly.oriented_envelope - input_poly - input_poly.convex_hull
-    ).buffer(-Consts.TRAPEZOID_CHECKER_EROSION)
-    
-    if isinstance(trapezoid_checker, MultiPolygon):
-        is_trapezoid = (
-            (len(trapezoid_checker.geoms) >= Consts.TRAPEZOID_CHECKER_TRIANGLE_COUNT)
-            and obb_ratio >= Consts.TRAPEZOID_OBB_RATIO_BASELINE
-        )
-    elif isinstance(trapezoid_checker, Polygon):
-        is_trapezoid = obb_ratio >= Consts.TRAPEZOID_OBB_RATIO_BASELINE
-    
-    triangle_checker = input_poly.union(
-        trapezoid_checker.buffer(Consts.TRAPEZOID_CHECKER_EROSION + Consts.TOLERANCE, join_style=JOIN_STYLE.mitre)
-    )
-     
-    is_triangle = (
-        np.isclose(get_interior_angle_sum(input_poly), Consts.TRIANGLE_ANGLE_SUM)
-        or get_obb_ratio(triangle_checker) >= Consts.TRIANGLE_OBB_RATIO_BASELINE
-    )
+    if is_satisfied_trapezoid_obb_ratio or not is_triangle:
+        with profiler.timer("trapezoid_check"):
+            # input polygon is inside its convex hull, so subtracting the hull alone leaves the same checker
+            trapezoid_checker = (input_poly.oriented_envelope - convex_hull).buffer(-Consts.TRAPEZOID_CHECKER_EROSION)
+            
+            if isinstance(trapezoid_checker, MultiPolygon):
+                is_trapezoid = (
+                    len(trapezoid_checker.geoms) >= Consts.TRAPEZOID_CHECKER_TRIANGLE_COUNT 
+                    and is_satisfied_trapezoid_obb_ratio
+                )
+            elif isinstance(trapezoid_checker, Polygon):
+                is_trapezoid = is_satisfied_trapezoid_obb_ratio
+    
+    if not is_triangle:
+        with profiler.timer("triangle_check"):
+            triangle_checker = input_poly.union(
+                trapezoid_checker.buffer(Consts.TRAPEZOID_CHECKER_EROSION + Consts.TOLERANCE, join_style=JOIN_STYLE.mitre)
+            )
+            is_triangle = get_obb_ratio(triangle_checker) >= Consts.TRIANGLE_OBB_RATIO_BASELINE
     
     shape_label = ShapeLabel.UndefinedShape.value
     
@@ -199,21 +181,87 @@ def get_estimated_shape_label(input_poly: Polygon, obb_ratio: float, aspect_rati
     return shape_label, int(is_rectangle), int(is_flag), int(is_trapezoid), int(is_triangle)
 
 
-def get_data_and_label():
-    """for training"""
-    square_shape_df = pandas.read_csv('data/end_data/SquareShape.csv')[:500]
-    long_square_shape_df = pandas.read_csv('data/end_data/LongSquareShape.csv')[:500]
-    flag_shape_df = pandas.read_csv('data/end_data/FlagShape.csv')[:500]
-    triangle_shape_df = pandas.read_csv('data/end_data/TriangleShape.csv')[:500]
-    trapezoid_shape_df = pandas.read_csv('data/end_data/TrapezoidShape.csv')[:500]
+def get_plot_geometry_column(plot_data_path: str) -> str:
+    """geometry column name of plot data file, wkt for csv and wkb for binary formats"""
+    return "plot_geometry_wkt" if get_plot_data_format(plot_data_path) == "csv" else "plot_geometry_wkb"
+
+
+def get_plot_data_format(plot_data_path: str) -> str:
+    """plot data file format from its extension"""
+    file_format = os.path.splitext(plot_data_path)[1][1:]
+    if file_format not in PLOT_DATA_FORMATS:
+        raise Exception(f"'{file_format}' is not supported plot data format")
+    
+    return file_format
+
+
+def read_plot_data(plot_data_path: str, columns: List[str] = None) -> pandas.DataFrame:
+    """read csv, parquet or feather plot data, binary formats read only the given columns"""
+    file_format = get_plot_data_format(plot_data_path)
+    
+    if file_format == "parquet":
+        plot_data_df = pandas.read_parquet(plot_data_path, columns=columns)
+    elif file_format == "feather":
+        plot_data_df = pandas.read_feather(plot_data_path, columns=columns)
+    else:
+        plot_data_df = pandas.read_csv(plot_data_path, usecols=columns)
+    
+    return plot_data_df if columns is None else plot_data_df[columns]
+
+
+def write_plot_data(plot_data_df: pandas.DataFrame, plot_data_path: str) -> None:
+    """write plot data, geometry is saved as wkt to csv and as wkb to binary formats"""
+    file_format = get_plot_data_format(plot_data_path)
+    plot_data_df = get_geometry_column_converted(plot_data_df, get_plot_geometry_column(plot_data_path))
     
+    if file_format == "parquet":
+        plot_data_df.to_parquet(plot_data_path, index=False)
+    elif file_format == "feather":
+        plot_data_df.reset_index(drop=True).to_feather(plot_data_path)
+    else:
+        plot_data_df.to_csv(plot_data_path, index=False)
+
+
+def convert_plot_data(plot_data_path: str, converted_plot_data_path: str) -> None:
+    """convert plot data between csv, parquet and feather"""
+    write_plot_data(read_plot_data(plot_data_path), converted_plot_data_path)
+
+
+def get_geometry_column_converted(plot_data_df: pandas.DataFrame, geometry_column: str) -> pandas.DataFrame:
+    """replace plot_geometry_wkt with plot_geometry_wkb or vice versa in place of the column"""
+    source_column = "plot_geometry_wkb" if geometry_column == "plot_geometry_wkt" else "plot_geometry_wkt"
+    if source_column not in plot_data_df.columns:
+        return plot_data_df
+    
+    plot_geometries = get_plot_data_geometries(plot_data_df)
+    if geometry_column == "plot_geometry_wkt":
+        converted = shapely.to_wkt(plot_geometries, rounding_precision=-1)
+    else:
+        converted = shapely.to_wkb(plot_geometries)
+    
+    plot_data_df = plot_data_df.copy()
+    plot_data_df[source_column] = converted
+    
+    return plot_data_df.rename(columns={source_column: geometry_column})
+
+
+def get_plot_data_geometries(plot_data_df: pandas.DataFrame) -> np.ndarray:
+    """plot geometries from plot data's wkb or wkt column, missing values are None"""
+    if "plot_geometry_wkb" in plot_data_df.columns:
+        return shapely.from_wkb(plot_data_df.plot_geometry_wkb.to_numpy(dtype=object, na_value=None))
+    
+    return shapely.from_wkt(plot_data_df.plot_geometry_wkt.to_numpy(dtype=object, na_value=None))
+
+
+def get_data_and_label(file_format: str = "csv", max_row: int = 500):
+    """for training, at most max_row plots per label, all if None"""
     columns = ["is_rectangle", "is_flag", "is_trapezoid", "is_triangle", "plot_aspect_ratio", "plot_obb_ratio", "plot_interior_angle_sum", "plot_label"]
     
-    square_df = square_shape_df[columns]
-    long_square_df = long_square_shape_df[columns]
-    flag_df = flag_shape_df[columns]
-    triangle_df = triangle_shape_df[columns]
-    trapezoid_df = trapezoid_shape_df[columns]
+    square_df = read_plot_data(f"data/end_data/SquareShape.{file_format}", columns)[:max_row]
+    long_square_df = read_plot_data(f"data/end_data/LongSquareShape.{file_format}", columns)[:max_row]
+    flag_df = read_plot_data(f"data/end_data/FlagShape.{file_format}", columns)[:max_row]
+    triangle_df = read_plot_data(f"data/end_data/TriangleShape.{file_format}", columns)[:max_row]
+    trapezoid_df = read_plot_data(f"data/end_data/TrapezoidShape.{file_format}", columns)[:max_row]
 
     return pandas.concat([square_df, long_square_df, flag_df, triangle_df, trapezoid_df], ignore_index=True)
 
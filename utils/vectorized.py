@@ -0,0 +1,681 @@
+from typing import Callable, Dict, List, Tuple
+from utils.consts import Consts
+from utils.utils import ShapeLabel
+from shapely.geometry import Polygon
+
+import math
+import shapely
+import numpy as np
+
+
+
+# same inset and cut as utils.get_cutted_mass
+MASS_INSET_DISTANCE = 0.1
+MASS_CUTTING_RATIO = 0.3
+
+MASS_CUTTING_STRATEGIES: Dict[str, Callable[[np.ndarray], np.ndarray]] = {}
+
+LABEL_INTERMEDIATE_COLUMNS = [
+    "plot_obb_ratio",
+    "plot_aspect_ratio",
+    "plot_interior_angle_sum",
+    "flag_checker_angle_sum",
+    "trapezoid_checker_part_count",
+    "triangle_checker_obb_ratio",
+]
+
+# Consts feeding simplification, obb or checker geometry, every other constant is only compared against intermediates
+GEOMETRY_CONSTS = ["TOLERANCE", "TOLERANCE_SLOPE", "TRAPEZOID_CHECKER_EROSION"]
+
+
+def get_ring_coords(input_poly: Polygon) -> np.ndarray:
+    """input polygon's exterior ring to (n, 2) coordinates array without the closing vertex"""
+    if len(input_poly.interiors) > 0:
+        raise Exception("'input_poly' boundary is not single LineString")
+
+    return np.asarray(input_poly.exterior.coords, dtype=float)[:-1, :2]
+
+
+def get_next_vertices(coords: np.ndarray) -> np.ndarray:
+    """ring vertices shifted by one, the i-th row is the (i + 1)-th vertex"""
+    return np.concatenate([coords[1:], coords[:1]])
+
+
+def get_prev_vertices(coords: np.ndarray) -> np.ndarray:
+    """ring vertices shifted by one, the i-th row is the (i - 1)-th vertex"""
+    return np.concatenate([coords[-1:], coords[:-1]])
+
+
+def get_segment_vectors(coords: np.ndarray) -> np.ndarray:
+    """(n, 2) vectors of ring segments, the i-th segment goes from the i-th to the (i + 1)-th vertex"""
+    return get_next_vertices(coords) - coords
+
+
+def get_segment_lengths(coords: np.ndarray) -> np.ndarray:
+    """lengths of ring segments"""
+    return np.hypot(*get_segment_vectors(coords).T)
+
+
+def get_segment_slopes(coords: np.ndarray) -> np.ndarray:
+    """slopes of ring segments, np.inf for vertical segments"""
+    dx, dy = get_segment_vectors(coords).T
+    is_vertical = np.isclose(dx, 0)
+
+    return np.where(is_vertical, np.inf, dy / np.where(is_vertical, 1, dx))
+
+
+def get_interior_angles(coords: np.ndarray) -> np.ndarray:
+    """angles in degrees between the previous and the next vertex at each ring vertex"""
+    p1_p2 = get_prev_vertices(coords) - coords
+    p3_p2 = get_next_vertices(coords) - coords
+
+    cosine_angle = (p1_p2 * p3_p2).sum(axis=1) / (np.hypot(*p1_p2.T) * np.hypot(*p3_p2.T))
+
+    return np.degrees(np.arccos(np.clip(cosine_angle, -1, 1)))
+
+
+def get_interior_angle_sum(coords: np.ndarray) -> float:
+    """sum of ring's interior angles"""
+    return float(get_interior_angles(coords).sum())
+
+
+def get_area(coords: np.ndarray) -> float:
+    """ring's area by shoelace formula"""
+    x, y = (coords - coords.mean(axis=0)).T
+    return float(abs(np.dot(x, np.append(y[1:], y[0])) - np.dot(y, np.append(x[1:], x[0]))) / 2)
+
+
+def get_convex_hull(coords: np.ndarray) -> np.ndarray:
+    """(h, 2) counter-clockwise convex hull vertices by monotone chain"""
+    points = sorted(set(map(tuple, coords.tolist())))
+    if len(points) < 3:
+        return np.array(points)
+
+    def get_half_hull(sorted_points: List[Tuple[float, float]]) -> List[Tuple[float, float]]:
+        half_hull = []
+        for px, py in sorted_points:
+            while len(half_hull) >= 2:
+                (ox, oy), (ax, ay) = half_hull[-2], half_hull[-1]
+                if (ax - ox) * (py - oy) - (ay - oy) * (px - ox) > 0:
+                    break
+                half_hull.pop()
+            half_hull.append((px, py))
+
+        return half_hull[:-1]
+
+    return np.array(get_half_hull(points) + get_half_hull(points[::-1]))
+
+
+def get_obb(coords: np.ndarray) -> Tuple[np.ndarray, float, float]:
+    """minimum area oriented bounding box by rotating calipers, returns its (4, 2) corners and side lengths
+
+    follows geos' MinimumAreaRectangle step by step, so rectangles of equal area are told apart by the same float noise
+    """
+    hull = get_convex_hull(coords)
+    if len(hull) < 3:
+        raise Exception("'coords' has a degenerate obb")
+
+    # geos' hull ring order, clockwise from the lowest then leftmost vertex
+    hull = hull[::-1]
+    start = np.lexsort((hull[:, 0], hull[:, 1]))[0]
+    ring = [tuple(point) for point in np.concatenate([hull[start:], hull[:start]]).tolist()]
+    ring_size = len(ring)
+
+    def get_distance(point: Tuple[float, float], p0: Tuple[float, float], p1: Tuple[float, float]) -> float:
+        (px, py), (x0, y0), (x1, y1) = point, p0, p1
+        length_squared = (x1 - x0) * (x1 - x0) + (y1 - y0) * (y1 - y0)
+        return abs(((y0 - py) * (x1 - x0) - (x0 - px) * (y1 - y0)) / length_squared) * math.sqrt(length_squared)
+
+    def get_furthest_index(p0: Tuple[float, float], p1: Tuple[float, float], start_index: int, side: int) -> int:
+        """rotate the caliper from start_index while the (side signed) distance to the p0-p1 line does not decrease"""
+
+        def get_side_distance(index: int) -> float:
+            distance = get_distance(ring[index], p0, p1)
+            if side == 0:
+                return distance
+
+            (px, py), (x0, y0), (x1, y1) = ring[index], p0, p1
+            is_right = (x1 - x0) * (py - y0) - (y1 - y0) * (px - x0) < 0
+            return side * (-distance if is_right else distance)
+
+        max_distance = next_distance = get_side_distance(start_index)
+        max_index = next_index = start_index
+        while next_distance >= max_distance:
+            max_distance, max_index = next_distance, next_index
+            next_index = (max_index + 1) % ring_size
+            if next_index == start_index:
+                break
+            next_distance = get_side_distance(next_index)
+
+        return max_index
+
+    min_area = math.inf
+    min_area_index, width, height = 0, 0.0, 0.0
+    diameter_index, left_index, right_index = 1, 1, 0
+    for i in range(ring_size):
+        p0, p1 = ring[i], ring[(i + 1) % ring_size]
+        (x0, y0), (x1, y1) = p0, p1
+        diameter_index = get_furthest_index(p0, p1, diameter_index, 0)
+
+        # the diameter goes from the furthest vertex's projection onto the edge to the furthest vertex
+        fx, fy = ring[diameter_index]
+        r = ((fx - x0) * (x1 - x0) + (fy - y0) * (y1 - y0)) / ((x1 - x0) * (x1 - x0) + (y1 - y0) * (y1 - y0))
+        base = (x0 + r * (x1 - x0), y0 + r * (y1 - y0))
+
+        left_index = get_furthest_index(base, ring[diameter_index], left_index, 1)
+        if i == 0:
+            right_index = diameter_index
+        right_index = get_furthest_index(base, ring[diameter_index], right_index, -1)
+
+        rectangle_width = get_distance(ring[left_index], base, ring[diameter_index]) + get_distance(
+            ring[right_index], base, ring[diameter_index]
+        )
+        rectangle_height = math.sqrt((base[0] - fx) * (base[0] - fx) + (base[1] - fy) * (base[1] - fy))
+
+        # strictly smaller, like geos the first one in ring order is kept among equal areas
+        if rectangle_height * rectangle_width < min_area:
+            min_area = rectangle_height * rectangle_width
+            min_area_index, width, height = i, rectangle_width, rectangle_height
+
+    origin = hull.mean(axis=0)
+    u = np.subtract(ring[(min_area_index + 1) % ring_size], ring[min_area_index])
+    u = u / np.hypot(*u)
+    v = np.array([-u[1], u[0]])
+
+    projected_u = (hull - origin) @ u
+    projected_v = (hull - origin) @ v
+
+    min_u, max_u = projected_u.min(), projected_u.max()
+    min_v, max_v = projected_v.min(), projected_v.max()
+
+    corners = origin + np.array([min_u * u + min_v * v, max_u * u + min_v * v, max_u * u + max_v * v, min_u * u + max_v * v])
+
+    return corners, width, height
+
+
+def get_aspect_ratio(coords: np.ndarray) -> float:
+    """ring's obb aspect ratio"""
+    aspect_ratio, _ = get_aspect_ratio_and_obb_ratio(coords)
+    return aspect_ratio
+
+
+def get_obb_ratio(coords: np.ndarray) -> float:
+    """ring's obb ratio"""
+    _, obb_ratio = get_aspect_ratio_and_obb_ratio(coords)
+    return obb_ratio
+
+
+def get_aspect_ratio_and_obb_ratio(coords: np.ndarray) -> Tuple[float, float]:
+    """ring's obb aspect ratio and obb ratio from a single obb computation"""
+    _, width, height = get_obb(coords)
+    return max(width, height) / min(width, height), get_area(coords) / (width * height)
+
+
+def get_cross_products(vectors: np.ndarray, other_vectors: np.ndarray) -> np.ndarray:
+    """z components of row-wise cross products of (n, 2) vectors"""
+    return vectors[:, 0] * other_vectors[:, 1] - vectors[:, 1] * other_vectors[:, 0]
+
+
+def get_is_same_slope(dx: float, dy: float, ref_dx: float, ref_dy: float) -> bool:
+    """np.isclose(slope, ref_slope, atol=Consts.TOLERANCE_SLOPE) multiplied out as a cross product bound, no np.inf"""
+    return abs(dy * ref_dx - ref_dy * dx) <= Consts.TOLERANCE_SLOPE * abs(dx * ref_dx) + 1e-5 * abs(ref_dy * dx)
+
+
+def get_collinear_removed_coords(coords: np.ndarray) -> np.ndarray:
+    """ring coordinates without closing vertex to coordinates whose consecutive same slope segments are merged
+
+    single pass with the same merge order as the segment merge loop utils.get_simplified_polygon used to run, the
+    running merged segment is compared with the current segment and the last segment is also compared with the first one
+    """
+    vertices = coords.tolist()
+    count = len(vertices)
+
+    # merged segments as (start, end) vertex indices
+    simplified = [[0, 1 % count]]
+    for si in range(count):
+        curr_start, curr_end = si, (si + 1) % count
+        prev_start, _ = simplified[-1]
+        next_start, next_end = simplified[0]
+
+        curr_dx = vertices[curr_end][0] - vertices[curr_start][0]
+        curr_dy = vertices[curr_end][1] - vertices[curr_start][1]
+
+        is_needed_merge_curr_and_prev = get_is_same_slope(
+            curr_dx,
+            curr_dy,
+            vertices[simplified[-1][1]][0] - vertices[prev_start][0],
+            vertices[simplified[-1][1]][1] - vertices[prev_start][1],
+        )
+
+        is_needed_merge_curr_and_next = si == count - 1 and get_is_same_slope(
+            curr_dx,
+            curr_dy,
+            vertices[next_end][0] - vertices[next_start][0],
+            vertices[next_end][1] - vertices[next_start][1],
+        )
+
+        if is_needed_merge_curr_and_prev and is_needed_merge_curr_and_next:
+            simplified.append([prev_start, next_end])
+            del simplified[0]
+            del simplified[-2]
+
+        elif is_needed_merge_curr_and_prev:
+            simplified[-1] = [prev_start, curr_end]
+
+        elif is_needed_merge_curr_and_next:
+            simplified.append([curr_start, next_end])
+            del simplified[0]
+
+        else:
+            simplified.append([curr_start, curr_end])
+
+    return coords[[start for start, _ in simplified]]
+
+
+def get_is_simple_ring(coords: np.ndarray) -> bool:
+    """whether ring segments meet only at the vertices shared by consecutive segments, checked for all pairs at once"""
+    count = len(coords)
+    segments = get_segment_vectors(coords)
+
+    # consecutive segments only overlap when the ring turns back on itself
+    next_segments = get_next_vertices(segments)
+    is_turned_back = (get_cross_products(segments, next_segments) == 0) & ((segments * next_segments).sum(axis=1) < 0)
+    if is_turned_back.any():
+        return False
+
+    si, sj = np.triu_indices(count, k=2)
+    is_non_consecutive = ~((si == 0) & (sj == count - 1))
+    si, sj = si[is_non_consecutive], sj[is_non_consecutive]
+
+    p, r = coords[si], segments[si]
+    q, s = coords[sj], segments[sj]
+
+    d1 = get_cross_products(r, q - p)
+    d2 = get_cross_products(r, q + s - p)
+    d3 = get_cross_products(s, p - q)
+    d4 = get_cross_products(s, p + r - q)
+    is_crossing = (d1 * d2 <= 0) & (d3 * d4 <= 0)
+
+    # collinear pairs intersect only if their projections onto the first segment overlap
+    is_collinear = (d1 == 0) & (d2 == 0)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        r_length_square = (r * r).sum(axis=1)
+        t0 = ((q - p) * r).sum(axis=1) / r_length_square
+        t1 = ((q + s - p) * r).sum(axis=1) / r_length_square
+    is_overlapped = np.maximum(np.minimum(t0, t1), 0) <= np.minimum(np.maximum(t0, t1), 1)
+
+    return not np.where(is_collinear, is_overlapped, is_crossing).any()
+
+
+def get_ragged_ring_coords(rings: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """array of closed rings to concatenated (m, 2) coordinates without closing vertices and their ring indices"""
+    coords, index = shapely.get_coordinates(rings, return_index=True)
+    is_closing_vertex = np.ones(len(index), dtype=bool)
+    is_closing_vertex[:-1] = index[1:] != index[:-1]
+
+    return coords[~is_closing_vertex], index[~is_closing_vertex]
+
+
+def get_ragged_neighbor_indices(index: np.ndarray, count: int) -> Tuple[np.ndarray, np.ndarray]:
+    """positions of each ragged ring vertex's previous and next vertex in the same ring"""
+    ring_sizes = np.bincount(index, minlength=count)
+    ring_starts = np.cumsum(ring_sizes) - ring_sizes
+
+    positions = np.arange(len(index))
+    local_positions = positions - ring_starts[index]
+    is_ring_start = local_positions == 0
+    is_ring_end = local_positions == ring_sizes[index] - 1
+
+    prev_indices = np.where(is_ring_start, positions + ring_sizes[index] - 1, positions - 1)
+    next_indices = np.where(is_ring_end, ring_starts[index], positions + 1)
+
+    return prev_indices, next_indices
+
+
+def get_ragged_interior_angle_sums(coords: np.ndarray, index: np.ndarray, count: int) -> np.ndarray:
+    """sums of interior angles of ragged rings, 0 for rings without vertices"""
+    prev_indices, next_indices = get_ragged_neighbor_indices(index, count)
+
+    p1_p2 = coords[prev_indices] - coords
+    p3_p2 = coords[next_indices] - coords
+
+    cosine_angle = (p1_p2 * p3_p2).sum(axis=1) / (np.hypot(*p1_p2.T) * np.hypot(*p3_p2.T))
+    angles = np.degrees(np.arccos(np.clip(cosine_angle, -1, 1)))
+
+    return np.bincount(index, weights=angles, minlength=count)
+
+
+def get_ragged_caliper_rectangles(
+    coords: np.ndarray, index: np.ndarray, count: int
+) -> Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+    """edge positions, widths along and heights across each edge and areas of the rotating calipers rectangles of
+    ragged clockwise convex rings
+
+    the arithmetic follows geos' MinimumAreaRectangle so that rectangles of equal area differ by the same float noise
+    """
+    ring_sizes = np.bincount(index, minlength=count)
+    ring_starts = np.cumsum(ring_sizes) - ring_sizes
+
+    _, next_indices = get_ragged_neighbor_indices(index, count)
+    dx, dy = (coords[next_indices] - coords).T
+    lengths_squared = dx * dx + dy * dy
+
+    edge_positions = np.flatnonzero(lengths_squared > 0)
+    if len(edge_positions) == 0:
+        return edge_positions, np.zeros(0), np.zeros(0), np.zeros(0)
+
+    edge_index = index[edge_positions]
+    x0, y0 = coords[edge_positions].T
+    dx, dy, lengths_squared = dx[edge_positions], dy[edge_positions], lengths_squared[edge_positions]
+
+    # pair every edge with every vertex of its own ring
+    pair_counts = ring_sizes[edge_index]
+    pair_starts = np.cumsum(pair_counts) - pair_counts
+    pair_edges = np.repeat(np.arange(len(edge_index)), pair_counts)
+    pair_vertices = ring_starts[edge_index][pair_edges] + np.arange(pair_counts.sum()) - pair_starts[pair_edges]
+    px, py = coords[pair_vertices].T
+
+    # the caliper opposite each edge stops at its first furthest vertex
+    base_distances = np.abs(
+        ((y0[pair_edges] - py) * dx[pair_edges] - (x0[pair_edges] - px) * dy[pair_edges]) / lengths_squared[pair_edges]
+    ) * np.sqrt(lengths_squared[pair_edges])
+    is_furthest = base_distances == np.maximum.reduceat(base_distances, pair_starts)[pair_edges]
+    furthest_pairs = np.flatnonzero(is_furthest)
+    fx, fy = coords[pair_vertices[furthest_pairs[np.unique(pair_edges[furthest_pairs], return_index=True)[1]]]].T
+
+    # the diameter goes from the furthest vertex's projection onto the edge to the furthest vertex
+    r = ((fx - x0) * dx + (fy - y0) * dy) / lengths_squared
+    bx, by = x0 + r * dx, y0 + r * dy
+    diameter_dx, diameter_dy = fx - bx, fy - by
+    diameter_lengths_squared = diameter_dx * diameter_dx + diameter_dy * diameter_dy
+
+    # signed distances to the diameter, the rectangle spans the furthest vertex on either side
+    side_factors = (
+        (by[pair_edges] - py) * diameter_dx[pair_edges] - (bx[pair_edges] - px) * diameter_dy[pair_edges]
+    ) / diameter_lengths_squared[pair_edges]
+    side_distances = np.abs(side_factors) * np.sqrt(diameter_lengths_squared[pair_edges])
+    side_distances = np.where(side_factors > 0, -side_distances, side_distances)
+
+    widths = np.maximum.reduceat(side_distances, pair_starts) - np.minimum.reduceat(side_distances, pair_starts)
+    heights = np.sqrt(diameter_lengths_squared)
+
+    return edge_positions, widths, heights, heights * widths
+
+
+def get_ragged_obb_sides(coords: np.ndarray, index: np.ndarray, count: int) -> Tuple[np.ndarray, np.ndarray]:
+    """minimum area obb side lengths of ragged clockwise convex rings by rotating calipers, nan for degenerate rings"""
+    edge_positions, widths, heights, areas = get_ragged_caliper_rectangles(coords, index, count)
+    edge_index = index[edge_positions]
+
+    # rectangles of equal area are ambiguous, like geos' oriented_envelope keep the first minimum in ring order
+    order = np.lexsort((areas, edge_index))
+
+    is_first_of_ring = np.ones(len(order), dtype=bool)
+    is_first_of_ring[1:] = edge_index[order][1:] != edge_index[order][:-1]
+    chosen_edges = order[is_first_of_ring]
+
+    obb_widths = np.full(count, np.nan)
+    obb_heights = np.full(count, np.nan)
+    obb_widths[edge_index[chosen_edges]] = widths[chosen_edges]
+    obb_heights[edge_index[chosen_edges]] = heights[chosen_edges]
+
+    is_degenerate = ~(obb_widths * obb_heights > 0)
+    obb_widths[is_degenerate] = np.nan
+    obb_heights[is_degenerate] = np.nan
+
+    return obb_widths, obb_heights
+
+
+def get_estimated_shape_labels(
+    input_polys: np.ndarray, obb_ratios: np.ndarray, aspect_ratios: np.ndarray, interior_angle_sums: np.ndarray
+) -> Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+    """array version of utils.get_estimated_shape_label, buffers use the same quad_segs as Polygon.buffer
+
+    checkers run only on the rows whose flag is not decided yet, the other rows are passed to shapely as None
+    """
+    count = len(input_polys)
+
+    is_satisfied_rectangle_obb_ratio = obb_ratios >= Consts.RECTANGLE_OBB_RATIO_BASELINE
+    is_rectangle = np.isclose(interior_angle_sums, Consts.RECTANGLE_ANGLE_SUM) & is_satisfied_rectangle_obb_ratio
+    is_lte_long_square_aspect_ratio_baseline = aspect_ratios <= Consts.LONG_SQUARE_SHAPE_ASPECT_RATIO_BASELINE
+
+    convex_hulls = shapely.convex_hull(input_polys)
+
+    is_satisfied_flag_obb_ratio = obb_ratios <= Consts.FLAG_OBB_RATIO_BASELINE
+    flag_checkers = shapely.difference(convex_hulls, np.where(is_satisfied_flag_obb_ratio, input_polys, None))
+    is_flag_checker_polygon = (shapely.get_type_id(flag_checkers) == 3) & ~shapely.is_empty(flag_checkers)
+    flag_checker_angle_sums = get_ragged_interior_angle_sums(
+        *get_ragged_ring_coords(shapely.get_exterior_ring(np.where(is_flag_checker_polygon, flag_checkers, None))),
+        count,
+    )
+    is_flag = (
+        is_flag_checker_polygon
+        & np.isclose(flag_checker_angle_sums, Consts.TRIANGLE_ANGLE_SUM)
+        & is_satisfied_flag_obb_ratio
+    )
+
+    is_triangle_angle_sum = np.isclose(interior_angle_sums, Consts.TRIANGLE_ANGLE_SUM)
+    is_satisfied_trapezoid_obb_ratio = obb_ratios >= Consts.TRAPEZOID_OBB_RATIO_BASELINE
+
+    # input polygons are inside their convex hulls, so subtracting the hulls alone leaves the same checkers
+    oriented_envelopes = shapely.oriented_envelope(
+        np.where(is_satisfied_trapezoid_obb_ratio | ~is_triangle_angle_sum, input_polys, None)
+    )
+    trapezoid_checkers = shapely.buffer(
+        shapely.difference(oriented_envelopes, convex_hulls),
+        -Consts.TRAPEZOID_CHECKER_EROSION,
+        quad_segs=16,
+    )
+    trapezoid_checker_type_ids = shapely.get_type_id(trapezoid_checkers)
+    is_trapezoid = is_satisfied_trapezoid_obb_ratio & (
+        (trapezoid_checker_type_ids == 3)
+        | (
+            (trapezoid_checker_type_ids == 6)
+            & (shapely.get_num_geometries(trapezoid_checkers) >= Consts.TRAPEZOID_CHECKER_TRIANGLE_COUNT)
+        )
+    )
+
+    triangle_checkers = shapely.union(
+        np.where(is_triangle_angle_sum, None, input_polys),
+        shapely.buffer(
+            trapezoid_checkers, Consts.TRAPEZOID_CHECKER_EROSION + Consts.TOLERANCE, quad_segs=16, join_style="mitre"
+        ),
+    )
+    with np.errstate(divide="ignore", invalid="ignore"):
+        triangle_checker_obb_ratios = shapely.area(triangle_checkers) / shapely.area(
+            shapely.oriented_envelope(triangle_checkers)
+        )
+    is_triangle = is_triangle_angle_sum | (triangle_checker_obb_ratios >= Consts.TRIANGLE_OBB_RATIO_BASELINE)
+
+    shape_labels = np.select(
+        [is_satisfied_rectangle_obb_ratio, is_flag, is_trapezoid, is_triangle],
+        [
+            np.where(
+                is_lte_long_square_aspect_ratio_baseline,
+                ShapeLabel.SquareShape.value,
+                ShapeLabel.LongSquareShape.value,
+            ),
+            ShapeLabel.FlagShape.value,
+            ShapeLabel.TrapezoidShape.value,
+            ShapeLabel.TriangleShape.value,
+        ],
+        default=ShapeLabel.UndefinedShape.value,
+    )
+
+    return (
+        shape_labels,
+        is_rectangle.astype(int),
+        is_flag.astype(int),
+        is_trapezoid.astype(int),
+        is_triangle.astype(int),
+    )
+
+
+def get_label_intermediates(
+    input_polys: np.ndarray, obb_ratios: np.ndarray, aspect_ratios: np.ndarray, interior_angle_sums: np.ndarray
+) -> Dict[str, np.ndarray]:
+    """continuous checker results behind get_estimated_shape_labels for every row, thresholds are not applied
+
+    the checker geometries depend only on TOLERANCE and TRAPEZOID_CHECKER_EROSION, so get_relabelled_shape_labels can
+    apply any other Consts to these arrays without touching geometry
+    """
+    count = len(input_polys)
+    convex_hulls = shapely.convex_hull(input_polys)
+
+    flag_checkers = shapely.difference(convex_hulls, input_polys)
+    is_flag_checker_polygon = (shapely.get_type_id(flag_checkers) == 3) & ~shapely.is_empty(flag_checkers)
+    flag_checker_angle_sums = get_ragged_interior_angle_sums(
+        *get_ragged_ring_coords(shapely.get_exterior_ring(np.where(is_flag_checker_polygon, flag_checkers, None))),
+        count,
+    )
+
+    trapezoid_checkers = shapely.buffer(
+        shapely.difference(shapely.oriented_envelope(input_polys), convex_hulls),
+        -Consts.TRAPEZOID_CHECKER_EROSION,
+        quad_segs=16,
+    )
+    trapezoid_checker_part_counts = np.where(
+        np.isin(shapely.get_type_id(trapezoid_checkers), [3, 6]), shapely.get_num_geometries(trapezoid_checkers), 0
+    )
+
+    triangle_checkers = shapely.union(
+        input_polys,
+        shapely.buffer(
+            trapezoid_checkers, Consts.TRAPEZOID_CHECKER_EROSION + Consts.TOLERANCE, quad_segs=16, join_style="mitre"
+        ),
+    )
+    with np.errstate(divide="ignore", invalid="ignore"):
+        triangle_checker_obb_ratios = shapely.area(triangle_checkers) / shapely.area(
+            shapely.oriented_envelope(triangle_checkers)
+        )
+
+    return {
+        "plot_obb_ratio": obb_ratios,
+        "plot_aspect_ratio": aspect_ratios,
+        "plot_interior_angle_sum": interior_angle_sums,
+        "flag_checker_angle_sum": np.where(is_flag_checker_polygon, flag_checker_angle_sums, np.nan),
+        "trapezoid_checker_part_count": trapezoid_checker_part_counts,
+        "triangle_checker_obb_ratio": triangle_checker_obb_ratios,
+    }
+
+
+def get_relabelled_shape_labels(
+    label_intermediates: Dict[str, np.ndarray]
+) -> Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+    """get_estimated_shape_labels from get_label_intermediates arrays with the current threshold Consts"""
+    obb_ratios = np.asarray(label_intermediates["plot_obb_ratio"], dtype=float)
+    interior_angle_sums = np.asarray(label_intermediates["plot_interior_angle_sum"], dtype=float)
+    trapezoid_checker_part_counts = np.asarray(label_intermediates["trapezoid_checker_part_count"])
+
+    is_satisfied_rectangle_obb_ratio = obb_ratios >= Consts.RECTANGLE_OBB_RATIO_BASELINE
+    is_rectangle = np.isclose(interior_angle_sums, Consts.RECTANGLE_ANGLE_SUM) & is_satisfied_rectangle_obb_ratio
+    is_lte_long_square_aspect_ratio_baseline = (
+        np.asarray(label_intermediates["plot_aspect_ratio"], dtype=float) <= Consts.LONG_SQUARE_SHAPE_ASPECT_RATIO_BASELINE
+    )
+
+    is_flag = np.isclose(
+        np.asarray(label_intermediates["flag_checker_angle_sum"], dtype=float), Consts.TRIANGLE_ANGLE_SUM
+    ) & (obb_ratios <= Consts.FLAG_OBB_RATIO_BASELINE)
+
+    # a polygon checker counts at any TRAPEZOID_CHECKER_TRIANGLE_COUNT, as in get_estimated_shape_label
+    is_trapezoid = (obb_ratios >= Consts.TRAPEZOID_OBB_RATIO_BASELINE) & (
+        (trapezoid_checker_part_counts == 1)
+        | ((trapezoid_checker_part_counts >= 2) & (trapezoid_checker_part_counts >= Consts.TRAPEZOID_CHECKER_TRIANGLE_COUNT))
+    )
+
+    is_triangle = np.isclose(interior_angle_sums, Consts.TRIANGLE_ANGLE_SUM) | (
+        np.asarray(label_intermediates["triangle_checker_obb_ratio"], dtype=float) >= Consts.TRIANGLE_OBB_RATIO_BASELINE
+    )
+
+    shape_labels = np.select(
+        [is_satisfied_rectangle_obb_ratio, is_flag, is_trapezoid, is_triangle],
+        [
+            np.where(
+                is_lte_long_square_aspect_ratio_baseline,
+                ShapeLabel.SquareShape.value,
+                ShapeLabel.LongSquareShape.value,
+            ),
+            ShapeLabel.FlagShape.value,
+            ShapeLabel.TrapezoidShape.value,
+            ShapeLabel.TriangleShape.value,
+        ],
+        default=ShapeLabel.UndefinedShape.value,
+    )
+
+    return (
+        shape_labels,
+        is_rectangle.astype(int),
+        is_flag.astype(int),
+        is_trapezoid.astype(int),
+        is_triangle.astype(int),
+    )
+
+
+def register_mass_cutting_strategy(shape_label: str) -> Callable:
+    """decorator registering an array function from insetted masses to cut masses for the shape label"""
+    def decorator(strategy: Callable[[np.ndarray], np.ndarray]) -> Callable[[np.ndarray], np.ndarray]:
+        MASS_CUTTING_STRATEGIES[shape_label] = strategy
+        return strategy
+
+    return decorator
+
+
+def get_longest_segment_vectors(input_polys: np.ndarray) -> np.ndarray:
+    """(n, 2) vectors of each polygon's longest exterior segment, the first in ring order on ties, nan if empty
+
+    the exteriors of all parts are searched for multipolygons
+    """
+    count = len(input_polys)
+    parts, part_index = shapely.get_parts(input_polys, return_index=True)
+    coords, ring_index = get_ragged_ring_coords(shapely.get_exterior_ring(parts))
+    index = part_index[ring_index]
+
+    _, next_indices = get_ragged_neighbor_indices(ring_index, len(parts))
+    vectors = coords[next_indices] - coords
+
+    # same arithmetic as LineString.length, so equally long segments tie as they do in utils.get_longest_segment
+    lengths = np.sqrt(vectors[:, 0] * vectors[:, 0] + vectors[:, 1] * vectors[:, 1])
+    order = np.lexsort((-lengths, index))
+    is_first_of_poly = np.ones(len(order), dtype=bool)
+    is_first_of_poly[1:] = index[order][1:] != index[order][:-1]
+    longest_segments = order[is_first_of_poly]
+
+    longest_segment_vectors = np.full((count, 2), np.nan)
+    longest_segment_vectors[index[longest_segments]] = vectors[longest_segments]
+
+    return longest_segment_vectors
+
+
+def get_translated(input_polys: np.ndarray, offsets: np.ndarray) -> np.ndarray:
+    """polygons translated by their (n, 2) offsets in one pass over the coordinates"""
+    coords, index = shapely.get_coordinates(input_polys, return_index=True)
+
+    return shapely.set_coordinates(np.array(input_polys, dtype=object), coords + offsets[index])
+
+
+@register_mass_cutting_strategy(ShapeLabel.LongSquareShape.name)
+def get_long_square_cutted_masses(masses: np.ndarray) -> np.ndarray:
+    """masses intersected with themselves moved along their longest segment by MASS_CUTTING_RATIO of it"""
+    moved_masses = get_translated(masses, get_longest_segment_vectors(masses) * MASS_CUTTING_RATIO)
+
+    return shapely.intersection(moved_masses, masses)
+
+
+def get_cutted_masses(input_polys: np.ndarray, shape_labels: np.ndarray) -> np.ndarray:
+    """array version of utils.get_cutted_mass, every registered shape label is cut by its strategy in one batch
+
+    rows of shape labels without a strategy, and rows whose inset is empty, are None
+    """
+    input_polys = np.asarray(input_polys, dtype=object)
+    shape_labels = np.asarray(shape_labels)
+
+    masses = shapely.buffer(input_polys, -MASS_INSET_DISTANCE, quad_segs=16)
+    masses[shapely.is_empty(masses)] = None
+
+    cutted_masses = np.full(len(input_polys), None, dtype=object)
+    for shape_label, strategy in MASS_CUTTING_STRATEGIES.items():
+        is_shape_label = (shape_labels == shape_label) & ~shapely.is_missing(masses)
+        if is_shape_label.any():
+            cutted_masses[is_shape_label] = strategy(masses[is_shape_label])
+
+    return cutted_masses